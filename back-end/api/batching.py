@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Dict, List, Set, Tuple
+
+from api.schedulers import TaskScheduler
+from api.task_executors import TaskExecutor
+
+__doc__ = """ Opt-in micro-batching of small tasks, so several of them share one LLM call and one rate-limit unit. """
+
+_CODE_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+class BatchTask:
+    """ Several compatible tasks asked in one structured prompt. """
+
+    prompt = "Answer each of the following {count} independent requests.\n\
+            Respond only with a JSON array of {count} strings, where item N is the complete answer to request N.\n\n{items}"
+
+    def __init__(self, tasks: list) -> None:
+        self.tasks = tasks
+
+    def to_prompt(self) -> str:
+        items = "\n\n".join(f"[{i}] {task.to_prompt()}"
+                            for i, task in enumerate(self.tasks, start=1))
+        return self.prompt.format(count=len(self.tasks), items=items)
+
+    def split(self, text: str) -> List[str]:
+        """ Splits the structured response into one answer per task.
+
+        Raises:
+            ValueError: If the response isn't a JSON array with one string per task.
+        """
+        answers = json.loads(_CODE_FENCE.sub('', text.strip()))
+        if not isinstance(answers, list) or len(answers) != len(self.tasks):
+            raise ValueError(
+                f"Expected a JSON array of {len(self.tasks)} answers.")
+        if not all(isinstance(answer, str) for answer in answers):
+            raise ValueError("Every answer must be a string.")
+        return answers
+
+    def __repr__(self) -> str:
+        return f"BatchTask(tasks={len(self.tasks)})"
+
+
+class MicroBatcher(TaskExecutor):
+    """ Wraps an executor and collects small 'batchable' tasks of the same kind for up to
+        'max_delay' seconds, then sends them as one prompt. Other tasks go straight through.
+        When a batched response can't be parsed, its tasks are retried one by one.
+    """
+
+    def __init__(self, executor: TaskExecutor, max_batch: int = 8,
+                 max_delay: float = 0.01, max_task_tokens: int = 256,
+                 scheduler: TaskScheduler = None) -> None:
+        """
+        Args:
+            executor: The executor that runs the calls.
+            max_batch: Maximum number of tasks per batch.
+            max_delay: Maximum number of seconds a task waits for others to join its batch.
+            max_task_tokens: Tasks with larger estimated prompts are never batched.
+            scheduler: Grants each batch one execution slot once it is full or its delay is over,
+                so tasks collect without holding a slot each. Batches run unscheduled when omitted.
+        """
+        if max_batch <= 0 or max_delay < 0:
+            raise ValueError(
+                "'max_batch' must be positive and 'max_delay' non-negative.")
+
+        self._executor = executor
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._max_task_tokens = max_task_tokens
+        self.scheduler = scheduler
+
+        self._pending: Dict[type, List[Tuple[object, asyncio.Future]]] = {}
+        self._timers: Dict[type, asyncio.TimerHandle] = {}
+        # Keeps a reference to running batches so they aren't garbage collected.
+        self._running: Set[asyncio.Task] = set()
+
+    def is_available(self) -> bool:
+        return self._executor.is_available()
+
+    def batchable(self, task) -> bool:
+        return (getattr(task, "batchable", False)
+                and task.estimate_tokens() <= self._max_task_tokens)
+
+    async def run_task(self, task) -> str:
+        if not self.batchable(task):
+            return await self._executor.run_task(task)
+
+        loop = asyncio.get_running_loop()
+        key = type(task)
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((task, future))
+
+        if len(batch) >= self._max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(
+                self._max_delay, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: type) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(key, [])
+        if batch:
+            running = asyncio.create_task(self._run_batch(batch))
+            self._running.add(running)
+            running.add_done_callback(self._running.discard)
+
+    async def _run_single(self, task, future: asyncio.Future) -> None:
+        try:
+            result = await self._executor.run_task(task)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_batch(self, batch: List[Tuple[object, asyncio.Future]]) -> None:
+        if self.scheduler is None:
+            await self._run_call(batch)
+            return
+
+        tasks = [task for task, _ in batch]
+        try:
+            await self.scheduler.acquire(priority=min(task.priority for task in tasks),
+                                         cost=sum(task.estimate_tokens() for task in tasks))
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        try:
+            await self._run_call(batch)
+        finally:
+            self.scheduler.release()
+
+    async def _run_call(self, batch: List[Tuple[object, asyncio.Future]]) -> None:
+        if len(batch) == 1:
+            await self._run_single(*batch[0])
+            return
+
+        batch_task = BatchTask([task for task, _ in batch])
+        try:
+            answers = batch_task.split(await self._executor.run_task(batch_task))
+        except ValueError as e:
+            logging.warning(
+                "Unable to split batched response (%s). Running %d tasks one by one.", e, len(batch))
+            await asyncio.gather(*(self._run_single(task, future)
+                                   for task, future in batch))
+            return
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logging.info("Ran %d tasks in one batched call.", len(batch))
+        for (_, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
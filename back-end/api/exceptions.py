@@ -11,3 +11,34 @@ class InvalidTaskName(Exception):
 class UnableToPublishTask(Exception):
     """ Custom exception raised when a task cannot be published to the queue. """
     pass
+
+
+class ServiceOverloaded(UnableToPublishTask):
+    """ Custom exception raised when a task is refused because too many are already waiting. """
+
+    def __init__(self, message: str, retry_after: float = 1) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(Exception):
+    """ Custom exception raised when a token exceeds its request quota. """
+
+    def __init__(self, message: str, retry_after: float = 0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimitExceeded(RateLimitExceeded):
+    """ Custom exception raised when a token has too many tasks in flight. """
+    pass
+
+
+class RegistryFullError(Exception):
+    """ Exception raised when a bounded registry is full of entries that can't be evicted. """
+    pass
+
+
+class InvalidTemplate(Exception):
+    """ Exception raised when a resume template or document format is unknown. """
+    pass
@@ -0,0 +1,179 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from api.registries import BoundedRegistry
+from api.tasks import TaskResponse
+
+load_dotenv()
+
+__doc__ = """ Consumer-side idempotency. Pub/Sub delivers at least once, so every request ID is claimed
+            before its task runs and its response is kept for a while afterwards; redeliveries reuse it
+            instead of running the task again. """
+
+
+class Claim(BaseModel):
+    """ Outcome of claiming a request ID. When not acquired, 'result' holds the response of
+        the delivery that already ran the task, or is None while that delivery is still running.
+    """
+    acquired: bool
+    result: Optional[TaskResponse] = None
+
+
+class ProcessedIdStore(ABC):
+    """ Abstract base class for the store of claimed and processed request IDs.
+        Every acquired claim must end with 'complete' or 'release'.
+    """
+    @abstractmethod
+    async def claim(self, request_id: str) -> Claim:
+        """ Claims a request ID for one delivery, unless another one ran it or is running it. """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def extend(self, request_id: str) -> None:
+        """ Renews the lease of a claim while its task is still running. """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete(self, request_id: str, result: TaskResponse) -> None:
+        """ Records the response of a claimed request, so redeliveries can reuse it. """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, request_id: str) -> None:
+        """ Drops a claim whose task failed, so a redelivery can run it again. """
+        raise NotImplementedError
+
+
+class InMemoryProcessedIdStore(ProcessedIdStore):
+    """ Per-process store. Only catches redeliveries to the same process. """
+
+    def __init__(self, ttl: float = 3600, lease: float = 120, maxsize: int = 10_000) -> None:
+        """
+        Args:
+            ttl: Seconds the response of a processed request is kept.
+            lease: Seconds after which a claim that wasn't extended expires, so a crashed task can be retried.
+            maxsize: Maximum number of processed and claimed IDs kept.
+        """
+        self._lock = threading.Lock()
+        self._claims: BoundedRegistry[str, bool] = BoundedRegistry(
+            "processed_ids.claims", maxsize=maxsize, ttl=lease)
+        # A lost response only costs running the task again.
+        self._results: BoundedRegistry[str, TaskResponse] = BoundedRegistry(
+            "processed_ids.results", maxsize=maxsize, ttl=ttl, evict_oldest=True)
+
+    async def claim(self, request_id: str) -> Claim:
+        with self._lock:
+            result = self._results.get(request_id)
+            if result is not None:
+                return Claim(acquired=False, result=result)
+            if request_id in self._claims:
+                return Claim(acquired=False)
+            self._claims.set(request_id, True)
+            return Claim(acquired=True)
+
+    async def extend(self, request_id: str) -> None:
+        with self._lock:
+            if request_id in self._claims:
+                self._claims.set(request_id, True)
+
+    async def complete(self, request_id: str, result: TaskResponse) -> None:
+        with self._lock:
+            self._results.set(request_id, result)
+            self._claims.pop(request_id)
+
+    async def release(self, request_id: str) -> None:
+        self._claims.pop(request_id)
+
+
+class UpstashProcessedIdStore(ProcessedIdStore):
+    """ Store shared by every worker through Upstash Redis. Each request ID is one key holding
+        either the running marker, with the lease as expiry, or the JSON response.
+    """
+
+    _RUNNING = "running"
+
+    # Returns nil when claimed, otherwise the current value of the key.
+    _CLAIM_SCRIPT = """
+        local value = redis.call('GET', KEYS[1])
+        if value then
+            return value
+        end
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', tonumber(ARGV[2]))
+        return false
+    """
+
+    _EXTEND_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+        end
+        return 0
+    """
+
+    _RELEASE_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, ttl: int = 3600, lease: int = 120,
+                 prefix: str = "processed-id", redis=None) -> None:
+        """
+        Args:
+            ttl: Seconds the response of a processed request is kept.
+            lease: Seconds after which a claim that wasn't extended expires, so a crashed worker's task can be retried.
+            prefix: Prefix of every Redis key used by the store.
+            redis: An 'upstash_redis.asyncio.Redis' client. Created from the environment when omitted.
+        """
+        if ttl <= 0 or lease <= 0:
+            raise ValueError("'ttl' and 'lease' must be positive.")
+
+        if redis is None:
+            from upstash_redis.asyncio import Redis
+            redis = Redis.from_env()
+
+        self._redis = redis
+        self._ttl = int(ttl)
+        self._lease = int(lease)
+        self._prefix = prefix
+
+    def _key(self, request_id: str) -> str:
+        return f"{self._prefix}:{request_id}"
+
+    async def claim(self, request_id: str) -> Claim:
+        value = await self._redis.eval(
+            self._CLAIM_SCRIPT,
+            keys=[self._key(request_id)],
+            args=[self._RUNNING, str(self._lease)]
+        )
+        if value is None:
+            return Claim(acquired=True)
+        if value == self._RUNNING:
+            return Claim(acquired=False)
+        return Claim(acquired=False, result=TaskResponse.model_validate_json(value))
+
+    async def extend(self, request_id: str) -> None:
+        await self._redis.eval(
+            self._EXTEND_SCRIPT,
+            keys=[self._key(request_id)],
+            args=[self._RUNNING, str(self._lease)]
+        )
+
+    async def complete(self, request_id: str, result: TaskResponse) -> None:
+        await self._redis.set(self._key(request_id), result.model_dump_json(), ex=self._ttl)
+
+    async def release(self, request_id: str) -> None:
+        try:
+            await self._redis.eval(
+                self._RELEASE_SCRIPT,
+                keys=[self._key(request_id)],
+                args=[self._RUNNING]
+            )
+        except Exception as e:
+            # The lease expires anyway, the retry is only delayed.
+            logging.exception("Unable to release claim of %s: %s", request_id, e)
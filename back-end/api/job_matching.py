@@ -0,0 +1,194 @@
+import heapq
+import logging
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from api.jobs import JobDescription, JobMatch
+
+__doc__ = """ Local resume to job description matching. Scores resumes against an index of job
+            descriptions and finds the job keywords missing from the resume, so prompts can carry
+            a short keyword hint instead of the whole job text. """
+
+_TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9+#]*(?:[.\-][a-z0-9+#]+)*")
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'in',
+    'is', 'it', 'its', 'of', 'on', 'or', 'our', 'that', 'the', 'this', 'to', 'we', 'will',
+    'with', 'you', 'your', 'their', 'they', 'us', 'who', 'what', 'can', 'all', 'any',
+    'about', 'into', 'etc', 'work', 'working', 'team', 'role', 'job', 'company', 'experience',
+    'years', 'strong', 'ability', 'skills', 'including', 'using', 'must', 'plus', 'well'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_PATTERN.findall(text.lower())
+            if token not in STOP_WORDS and len(token) > 1]
+
+
+def _columns(tokens: Iterable[str], features: int) -> np.ndarray:
+    """ Hashed feature columns of the tokens. crc32 is stable across processes, unlike 'hash'. """
+    return np.fromiter((zlib.crc32(token.encode()) % features for token in tokens),
+                       dtype=np.intp)
+
+
+class JobIndex:
+    """ TF-IDF index of job descriptions over a fixed number of hashed term features.
+        Each job only stores its distinct columns and their weights, so memory grows with the
+        number of terms rather than the feature width, and a resume is scored against every
+        job with one pass over a CSR-style concatenation of the rows.
+        Adding or removing a job only touches its own row.
+    """
+
+    def __init__(self, features: int = 2 ** 13) -> None:
+        """
+        Args:
+            features: Width of the term vectors. Terms hashed to the same column share a weight.
+        """
+        self._features = features
+        self._lock = threading.Lock()
+        self._job_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        # Distinct terms of each job and their column, to name the missing keywords.
+        self._terms: List[Dict[str, int]] = []
+        # Sorted distinct columns of each job and their sublinear term frequencies.
+        self._rows: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._document_frequency = np.zeros(features, dtype=np.int64)
+        self._idf = np.ones(features, dtype=np.float32)
+        # Concatenated rows, rebuilt when the jobs change: row of each entry, columns and weights.
+        self._row_ids = np.zeros(0, dtype=np.int32)
+        self._columns = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._stale = False
+
+    def add(self, jobs: Iterable[JobDescription]) -> None:
+        """ Adds or replaces job descriptions. """
+        with self._lock:
+            for job in jobs:
+                tokens = tokenize(f"{job.title} {job.text}")
+                columns = _columns(tokens, self._features)
+                unique, counts = np.unique(columns, return_counts=True)
+                entry = (unique.astype(np.int32), np.log1p(counts).astype(np.float32))
+
+                row = self._positions.get(job.id)
+                if row is None:
+                    row = len(self._job_ids)
+                    self._job_ids.append(job.id)
+                    self._terms.append({})
+                    self._rows.append(entry)
+                    self._positions[job.id] = row
+                else:
+                    self._document_frequency[self._rows[row][0]] -= 1
+                    self._rows[row] = entry
+
+                self._document_frequency[entry[0]] += 1
+                self._terms[row] = dict(zip(tokens, columns.tolist()))
+            self._stale = True
+            logging.info("JobIndex: Indexed %d jobs.", len(self._job_ids))
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            row = self._positions.pop(job_id, None)
+            if row is None:
+                return
+            self._document_frequency[self._rows[row][0]] -= 1
+
+            # The last job takes the freed row.
+            last = len(self._job_ids) - 1
+            if row != last:
+                self._rows[row] = self._rows[last]
+                self._job_ids[row] = self._job_ids[last]
+                self._terms[row] = self._terms[last]
+                self._positions[self._job_ids[row]] = row
+            self._rows.pop()
+            self._job_ids.pop()
+            self._terms.pop()
+            self._stale = True
+
+    def _refresh(self) -> None:
+        """ Recomputes the IDF, the concatenated rows and their norms after the jobs changed.
+            Call it with the lock held.
+        """
+        if not self._stale:
+            return
+        count = len(self._job_ids)
+        self._idf = (np.log((1 + count) / (1 + self._document_frequency)) + 1).astype(np.float32)
+
+        lengths = [len(columns) for columns, _ in self._rows]
+        self._row_ids = np.repeat(np.arange(count, dtype=np.int32), lengths)
+        self._columns = np.concatenate(
+            [columns for columns, _ in self._rows] or [np.zeros(0, dtype=np.int32)])
+        self._weights = np.concatenate(
+            [weights for _, weights in self._rows] or [np.zeros(0, dtype=np.float32)])
+
+        weighted = self._weights * self._idf[self._columns]
+        self._norms = np.sqrt(
+            np.bincount(self._row_ids, weights=weighted * weighted, minlength=count))
+        self._norms[self._norms == 0] = 1
+        self._stale = False
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        columns = _columns(tokenize(text), self._features)
+        vector = np.log1p(np.bincount(columns, minlength=self._features).astype(np.float32))
+        vector *= self._idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _missing_keywords(self, row: int, vector: np.ndarray, keywords: int) -> List[str]:
+        """ Heaviest terms of a job whose column is absent from the resume vector. """
+        columns, weights = self._rows[row]
+        weights = dict(zip(columns.tolist(), (weights * self._idf[columns]).tolist()))
+        missing = [(weights[column], term) for term, column in self._terms[row].items()
+                   if vector[column] == 0]
+        return [term for _, term in heapq.nlargest(keywords, missing)]
+
+    def match(self, resume_text: str, top_k: int = 5, keywords: int = 10) -> List[JobMatch]:
+        """ Ranks the indexed jobs by cosine similarity to the resume.
+
+        Args:
+            resume_text: The text extracted from the resume.
+            top_k: Number of jobs to return.
+            keywords: Number of missing keywords to return per job, heaviest first.
+
+        Returns:
+            The best matching jobs, highest score first.
+        """
+        with self._lock:
+            count = len(self._job_ids)
+            if not count or top_k <= 0:
+                return []
+            self._refresh()
+
+            vector = self._vectorize(resume_text)
+            products = self._weights * (vector * self._idf)[self._columns]
+            scores = np.bincount(self._row_ids, weights=products, minlength=count) / self._norms
+
+            top_k = min(top_k, count)
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+
+            return [JobMatch(job_id=self._job_ids[row], score=float(scores[row]),
+                             missing_keywords=self._missing_keywords(row, vector, keywords))
+                    for row in top]
+
+    def hint(self, resume_text: str, job_id: str, keywords: int = 10) -> str:
+        """ Compact prompt hint with the keywords of one job missing from the resume.
+
+        Raises:
+            KeyError: If the job isn't indexed.
+        """
+        with self._lock:
+            row = self._positions.get(job_id)
+            if row is None:
+                raise KeyError(f"Job '{job_id}' is not indexed.")
+            self._refresh()
+
+            vector = self._vectorize(resume_text)
+            return ", ".join(self._missing_keywords(row, vector, keywords))
+
+    def __len__(self) -> int:
+        return len(self._job_ids)
@@ -0,0 +1,18 @@
+from typing import List
+
+from pydantic import BaseModel
+
+__doc__ = """ Job description models, kept apart from 'api.job_matching' so the API can
+            declare its endpoints without importing NumPy on cold start. """
+
+
+class JobDescription(BaseModel):
+    id: str
+    title: str = ""
+    text: str
+
+
+class JobMatch(BaseModel):
+    job_id: str
+    score: float
+    missing_keywords: List[str]
@@ -0,0 +1,144 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, Optional
+
+__doc__ = """ Logging setup. LOG_MODE=production keeps logging off the request path: records are
+            enqueued unformatted and a background thread truncates, formats as JSON lines and
+            writes them. Chatty messages can also be sampled. """
+
+
+class SamplingFilter(logging.Filter):
+    """ Keeps one in every 'every' records of each message template below 'level'.
+        Templates are the unformatted messages, so calls must pass their values as arguments.
+    """
+
+    def __init__(self, every: int = 1, level: int = logging.WARNING,
+                 max_templates: int = 1024) -> None:
+        super().__init__()
+        if every <= 0:
+            raise ValueError("'every' must be positive.")
+
+        self._every = every
+        self._level = level
+        self._max_templates = max_templates
+        self._counters: Dict[str, Iterator[int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self._every == 1 or record.levelno >= self._level:
+            return True
+
+        counter = self._counters.get(record.msg)
+        if counter is None:
+            if len(self._counters) >= self._max_templates:
+                self._counters.clear()  # Messages formatted before logging would grow it forever
+            counter = self._counters.setdefault(record.msg, itertools.count())
+        return next(counter) % self._every == 0
+
+
+class TruncatingFilter(logging.Filter):
+    """ Caps the length of messages, so large payloads are never written whole. """
+
+    def __init__(self, max_length: int = 512) -> None:
+        super().__init__()
+        self._max_length = max_length
+
+    def _truncate(self, text: str) -> str:
+        if len(text) <= self._max_length:
+            return text
+        return f"{text[:self._max_length]}...[{len(text) - self._max_length} truncated]"
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        args = record.args
+        if isinstance(args, tuple):
+            # Cut long strings before formatting, so they are never copied whole.
+            args = tuple(self._truncate(arg) if isinstance(arg, (str, bytes)) else arg
+                         for arg in args)
+        try:
+            message = str(record.msg) % args if args else str(record.msg)
+        except (TypeError, ValueError):
+            return True  # Left as is, so the handler reports the bad arguments
+        record.msg, record.args = self._truncate(message), None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats records as one JSON object per line. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """ Enqueues records unformatted, so formatting happens on the listener thread.
+        Records are dropped when the queue is full instead of blocking the caller.
+    """
+
+    def __init__(self, queue) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SafeQueueListener(QueueListener):
+    """ QueueListener that can be stopped more than once, e.g. by a test and then at exit. """
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+
+
+def configure_logging(level: int = logging.INFO, mode: str = None) -> Optional[SafeQueueListener]:
+    """ Configures the root logger for the given LOG_MODE.
+
+    Args:
+        level: The root logger level.
+        mode: 'production' for queued JSON logging, anything else for the plain default setup.
+            Read from LOG_MODE when omitted.
+
+    Returns:
+        The started listener in production mode, which is stopped at exit.
+    """
+    mode = mode or os.getenv('LOG_MODE', 'development')
+    if mode != 'production':
+        logging.basicConfig(level=level)
+        return None
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(TruncatingFilter(int(os.getenv('LOG_MAX_LENGTH', 512))))
+
+    records = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10_000)))
+    queue_handler = DeferredQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(int(os.getenv('LOG_SAMPLE_EVERY', 1))))
+
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = SafeQueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
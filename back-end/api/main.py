@@ -2,20 +2,41 @@ import asyncio
 import json
 import logging
 import os
+import signal
+import threading
 import uuid
+from contextlib import asynccontextmanager
 from io import BytesIO
+from typing import TYPE_CHECKING, List, Optional
 
 from dotenv import load_dotenv
 from fastapi import (BackgroundTasks, FastAPI, File, HTTPException, Response,
                      UploadFile, status)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from PyPDF2 import PdfReader
 
-from api.task_api import request_task
+from api.exceptions import (InvalidTemplate, RateLimitExceeded,
+                            ServiceOverloaded)
+from api.jobs import JobDescription, JobMatch
+from api.logs import configure_logging
+from api.profiling import ProfilingMiddleware
+from api.rendering import FORMATS, DocumentRenderer, ResumeTemplate
+from api.task_api import reload_topics, request_task, shutdown_tasks
+from api.tasks import TaskResponse
+
+if TYPE_CHECKING:
+    from api.job_matching import JobIndex
 
 load_dotenv()
 
 user_data = {}  # Implement JWT
+_job_index: Optional['JobIndex'] = None
+_job_index_lock = threading.Lock()
+renderer = DocumentRenderer(
+    max_workers=int(os.getenv('RENDER_WORKERS', 0)) or None,
+    cache_size=int(os.getenv('RENDER_CACHE_SIZE', 256))
+)
 
 if bool(os.getenv('DEBUG')):
     level = logging.DEBUG
@@ -25,9 +46,31 @@ else:
     level = logging.INFO
     logging.info('Running on Production mode.')
 
-logging.basicConfig(level=level)
+configure_logging(level)
+
+
+def get_job_index() -> 'JobIndex':
+    """ Creates the job index on first use, so NumPy isn't imported on cold start. """
+    global _job_index
+    if _job_index is None:
+        with _job_index_lock:
+            if _job_index is None:
+                from api.job_matching import JobIndex
+                _job_index = JobIndex()
+    return _job_index
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Signal handlers can only be set from the main thread, which test clients don't run on.
+    if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_topics)
+    yield
+    renderer.shutdown(wait=False)
+    await shutdown_tasks()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,6 +80,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if os.getenv('PROFILE_DIR'):
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=os.getenv('PROFILE_DIR'),
+        sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+        token=os.getenv('PROFILE_TOKEN')
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={'detail': str(exc)},
+        headers={'Retry-After': str(max(1, round(exc.retry_after)))}
+    )
+
+
+@app.exception_handler(ServiceOverloaded)
+async def service_overloaded_handler(request, exc: ServiceOverloaded):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': str(exc)},
+        headers={'Retry-After': str(max(1, round(exc.retry_after)))}
+    )
+
+
 @app.get('/auth')
 def get_auth():
     token = str(uuid.uuid4())
@@ -55,8 +125,7 @@ def valid_resume(text: str) -> bool:
     return count / len(keywords) > 0.5
 
 
-@app.post('/resume')
-async def post_resume(token: str, resume: UploadFile = File(...)):
+async def read_resume(token: str, resume: UploadFile) -> str:
     if token not in user_data:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail='Invalid token.')
@@ -75,14 +144,70 @@ async def post_resume(token: str, resume: UploadFile = File(...)):
             status_code=status.HTTP_400_BAD_REQUEST, detail='Not a resume.')
     return text
 
+
+@app.post('/resume')
+async def post_resume(token: str, resume: UploadFile = File(...),
+                      job_id: Optional[str] = None):
+    text = await read_resume(token, resume)
+    payload = {"text": text}
+    if job_id is not None:
+        try:
+            payload["job_hint"] = await asyncio.to_thread(
+                get_job_index().hint, text, job_id)
+        except KeyError as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=str(e))
+
     request = {
         "auth": token,
         "task_name": "resume-optimization",
-        "payload": {
-            "text": text
-        }
+        "payload": payload
     }
 
     res = await request_task(request)
     return res
 
+
+@app.post('/job-information')
+def post_job_information(token: str, jobs: List[JobDescription]):
+    if token not in user_data:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail='Invalid token.')
+
+    job_index = get_job_index()
+    job_index.add(jobs)
+    return {'jobs': len(job_index)}
+
+
+@app.post('/job-information/match', response_model=List[JobMatch])
+async def match_job_information(token: str, resume: UploadFile = File(...),
+                                top_k: int = 5):
+    text = await read_resume(token, resume)
+    # Scoring a large catalogue would block the event loop.
+    return await asyncio.to_thread(get_job_index().match, text, top_k=top_k)
+
+
+@app.get('/resume-template', response_model=List[ResumeTemplate])
+def get_resume_templates():
+    return renderer.templates
+
+
+@app.post('/resume-template/{template_id}')
+async def render_resume_template(token: str, template_id: str, response: TaskResponse,
+                                 fmt: str = 'pdf'):
+    if token not in user_data:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail='Invalid token.')
+
+    try:
+        document = await renderer.render(response, template_id, fmt)
+    except InvalidTemplate as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail='Response has no optimized resume.')
+
+    return Response(content=document, media_type=FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="resume-{template_id}.{fmt}"'
+    })
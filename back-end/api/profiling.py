@@ -0,0 +1,146 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+__doc__ = """ Opt-in request profiling. A sampling profiler records the stacks of profiled requests
+            and writes them in the folded format read by flamegraph.pl and speedscope.
+            The middleware is only installed when PROFILE_DIR is set, so it costs nothing otherwise. """
+
+_UNSAFE_PATH = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_stack(coro) -> List[str]:
+    """ Follows the chain of awaits of a suspended coroutine down to the awaited object,
+        e.g. the lock or future a request is blocked on.
+    """
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            # Futures are awaited through their iterator, e.g. 'FutureIter'.
+            stack.append(f"[await {type(coro).__name__.removesuffix('Iter')}]")
+            break
+        stack.append(_label(frame))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return stack
+
+
+class SamplingProfiler:
+    """ Samples one asyncio task from a background thread.
+        While the task runs, the stack of its event loop thread is recorded. While it is
+        suspended, its chain of awaits is, so time spent waiting on locks, I/O or other tasks shows up too.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        if interval <= 0:
+            raise ValueError("'interval' must be positive.")
+
+        self._interval = interval
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, task: asyncio.Task, thread_id: int = None) -> None:
+        thread_id = thread_id or threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, args=(task, thread_id),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _sample(self, task: asyncio.Task, thread_id: int) -> None:
+        coro = task.get_coro()
+        while not self._stop.wait(self._interval):
+            if getattr(coro, 'cr_running', False):
+                frame = sys._current_frames().get(thread_id)
+                stack = _thread_stack(frame)
+            else:
+                stack = _await_stack(coro)
+            if stack:
+                self._stacks[';'.join(stack)] += 1
+
+    def stop(self) -> Counter:
+        """ Stops sampling and returns the number of samples per folded stack. """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self._stacks
+
+
+def write_folded(path: str, stacks: Counter) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.items():
+            f.write(f"{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """ ASGI middleware profiling requests that carry the profile header with the token, or a
+        random 'sample_rate' share of all requests. Each profile is written to 'directory'.
+    """
+
+    def __init__(self, app, directory: str, sample_rate: float = 0.0,
+                 header: str = 'x-profile', token: str = None, interval: float = 0.005) -> None:
+        """
+        Args:
+            app: The ASGI app to wrap.
+            directory: Where the '.folded' profiles are written.
+            sample_rate: Share of requests profiled without the header, from 0 to 1.
+            header: The header that asks for a profile.
+            token: The value the header must carry. Without it the header is ignored,
+                so clients can't make the server profile and write to disk at will.
+            interval: Seconds between samples.
+        """
+        self.app = app
+        self._directory = directory
+        self._sample_rate = sample_rate
+        self._header = header.lower().encode('latin-1')
+        self._token = token.encode('latin-1') if token else None
+        self._interval = interval
+        os.makedirs(directory, exist_ok=True)
+
+    def _requested(self, scope) -> bool:
+        if self._token:
+            for name, value in scope.get('headers', ()):
+                if name == self._header:
+                    return hmac.compare_digest(value, self._token)
+        return random.random() < self._sample_rate
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(self._interval)
+        profiler.start(asyncio.current_task())
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            stacks = profiler.stop()
+            name = _UNSAFE_PATH.sub('_', f"{scope['method']}{scope['path']}").strip('_')
+            path = os.path.join(self._directory,
+                                f"{time.time_ns() // 1_000_000}-{name}.folded")
+            await asyncio.get_running_loop().run_in_executor(None, write_folded, path, stacks)
+            logging.info(
+                "Profiled %s %s in %.1f ms: %s", scope['method'], scope['path'], elapsed * 1000, path)
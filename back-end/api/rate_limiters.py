@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict
+
+from dotenv import load_dotenv
+
+from api.exceptions import ConcurrencyLimitExceeded, RateLimitExceeded
+
+load_dotenv()
+
+
+class RateLimiter(ABC):
+    """ Abstract base class for per-token request quotas.
+        Every successful 'acquire' must be paired with a 'release' of the returned slot once the task is done.
+    """
+    @abstractmethod
+    async def acquire(self, key: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, key: str, slot: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """ Sliding window log limiter for a single process.
+        In-flight slots are leases that expire after 'task_ttl' seconds, so a lost task can't lock a token out.
+        Releasing a slot that already expired is a no-op.
+    """
+
+    def __init__(self, limit: int = 10, period: float = 60,
+                 max_concurrent: int = 2, task_ttl: float = 300) -> None:
+        """
+        Args:
+            limit: Maximum number of requests per token inside the window.
+            period: Window length in seconds.
+            max_concurrent: Maximum number of tasks in flight per token.
+            task_ttl: Seconds after which an unreleased in-flight slot expires.
+        """
+        if limit <= 0 or period <= 0 or max_concurrent <= 0 or task_ttl <= 0:
+            raise ValueError(
+                "'limit', 'period', 'max_concurrent' and 'task_ttl' must be positive.")
+
+        self._limit = limit
+        self._period = period
+        self._max_concurrent = max_concurrent
+        self._task_ttl = task_ttl
+
+        self._lock = asyncio.Lock()
+        self._key_to_window: Dict[str, Deque[float]] = {}
+        # Expiry time of each slot in flight, by slot id, oldest first.
+        self._key_to_active: Dict[str, Dict[str, float]] = {}
+        self._sweep_threshold = 1024
+
+    async def acquire(self, key: str) -> str:
+        """ Records a request for the given key.
+
+        Args:
+            key: The token the quota belongs to.
+
+        Returns:
+            The id of the in-flight slot, to be passed to 'release'.
+
+        Raises:
+            RateLimitExceeded: If the key already made 'limit' requests in the last 'period' seconds.
+            ConcurrencyLimitExceeded: If the key already has 'max_concurrent' tasks in flight.
+        """
+        now = time.monotonic()
+        async with self._lock:
+            if len(self._key_to_window) > self._sweep_threshold:
+                self._sweep(now)
+
+            window = self._key_to_window.setdefault(key, deque())
+            while window and window[0] <= now - self._period:
+                window.popleft()
+
+            if len(window) >= self._limit:
+                retry_after = window[0] + self._period - now
+                logging.warning("Rate limit exceeded for token: '%s'.", key)
+                raise RateLimitExceeded(
+                    f"Rate limit of {self._limit} requests per {self._period}s exceeded.",
+                    retry_after=retry_after)
+
+            active = self._key_to_active.get(key)
+            if active:
+                self._expire_slots(key, active, now)
+            if active and len(active) >= self._max_concurrent:
+                logging.warning(
+                    "Concurrency limit exceeded for token: '%s'.", key)
+                raise ConcurrencyLimitExceeded(
+                    f"Limit of {self._max_concurrent} concurrent tasks exceeded.")
+
+            slot = str(uuid.uuid4())
+            window.append(now)
+            self._key_to_active.setdefault(key, {})[slot] = now + self._task_ttl
+            return slot
+
+    async def release(self, key: str, slot: str) -> None:
+        async with self._lock:
+            active = self._key_to_active.get(key)
+            if active:
+                active.pop(slot, None)
+            if not active:
+                self._key_to_active.pop(key, None)
+
+    def _expire_slots(self, key: str, active: Dict[str, float], now: float) -> None:
+        expired = [slot for slot, expiry in active.items() if expiry <= now]
+        for slot in expired:
+            del active[slot]
+            logging.warning(
+                "In-flight slot of token '%s' expired without being released.", key)
+
+    def _sweep(self, now: float) -> None:
+        """ Drops idle keys so the windows don't grow with every token ever seen. """
+        idle = [key for key, window in self._key_to_window.items()
+                if key not in self._key_to_active
+                and (not window or window[-1] <= now - self._period)]
+        for key in idle:
+            self._key_to_window.pop(key)
+        self._sweep_threshold = max(1024, 2 * len(self._key_to_window))
+
+
+class UpstashRateLimiter(RateLimiter):
+    """ Sliding window limiter shared by every worker through Upstash Redis.
+        The in-flight slots are a sorted set scored by their expiry, so each lost slot expires on its own.
+    """
+
+    # Returns {0} when accepted, {1, oldest request time} when the window is full
+    # and {2} when too many tasks are in flight.
+    # The time is returned as a string, Redis would truncate a Lua number to an integer.
+    _ACQUIRE_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        local period = tonumber(ARGV[2])
+        local task_ttl = tonumber(ARGV[6])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - period)
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+            local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+            return {1, oldest[2]}
+        end
+        redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+        if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[4]) then
+            return {2}
+        end
+        redis.call('ZADD', KEYS[1], now, ARGV[5])
+        redis.call('PEXPIRE', KEYS[1], math.ceil(period * 1000))
+        redis.call('ZADD', KEYS[2], now + task_ttl, ARGV[5])
+        redis.call('PEXPIRE', KEYS[2], math.ceil(task_ttl * 1000))
+        return {0}
+    """
+
+    _RELEASE_SCRIPT = """
+        return redis.call('ZREM', KEYS[1], ARGV[1])
+    """
+
+    def __init__(self, limit: int = 10, period: float = 60,
+                 max_concurrent: int = 2, task_ttl: float = 300,
+                 prefix: str = "rate-limit", redis=None) -> None:
+        """
+        Args:
+            limit: Maximum number of requests per token inside the window.
+            period: Window length in seconds.
+            max_concurrent: Maximum number of tasks in flight per token.
+            task_ttl: Seconds after which an unreleased in-flight slot expires, so a crashed worker can't lock a token out.
+            prefix: Prefix of every Redis key used by the limiter.
+            redis: An 'upstash_redis.asyncio.Redis' client. Created from the environment when omitted.
+        """
+        if limit <= 0 or period <= 0 or max_concurrent <= 0 or task_ttl <= 0:
+            raise ValueError(
+                "'limit', 'period', 'max_concurrent' and 'task_ttl' must be positive.")
+
+        if redis is None:
+            from upstash_redis.asyncio import Redis
+            redis = Redis.from_env()
+
+        self._redis = redis
+        self._limit = limit
+        self._period = period
+        self._max_concurrent = max_concurrent
+        self._task_ttl = task_ttl
+        self._prefix = prefix
+
+    def _keys(self, key: str) -> tuple[str, str]:
+        return f"{self._prefix}:{key}:window", f"{self._prefix}:{key}:active"
+
+    async def acquire(self, key: str) -> str:
+        window_key, active_key = self._keys(key)
+        slot = str(uuid.uuid4())
+        now = time.time()
+        status, *rest = await self._redis.eval(
+            self._ACQUIRE_SCRIPT,
+            keys=[window_key, active_key],
+            args=[str(now), str(self._period), str(self._limit),
+                  str(self._max_concurrent), slot, str(self._task_ttl)]
+        )
+
+        if int(status) == 1:
+            retry_after = max(float(rest[0]) + self._period - now, 0)
+            logging.warning("Rate limit exceeded for token: '%s'.", key)
+            raise RateLimitExceeded(
+                f"Rate limit of {self._limit} requests per {self._period}s exceeded.",
+                retry_after=retry_after)
+        if int(status) == 2:
+            logging.warning("Concurrency limit exceeded for token: '%s'.", key)
+            raise ConcurrencyLimitExceeded(
+                f"Limit of {self._max_concurrent} concurrent tasks exceeded.")
+        return slot
+
+    async def release(self, key: str, slot: str) -> None:
+        _, active_key = self._keys(key)
+        await self._redis.eval(self._RELEASE_SCRIPT, keys=[active_key], args=[slot])
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, List, Optional, TypeVar
+
+from api.exceptions import RegistryFullError
+
+__doc__ = """ Bounded bookkeeping for long-running processes, so per-request maps can't grow without limit. """
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BoundedRegistry(Generic[K, V]):
+    """ Thread-safe map whose entries are evicted when they complete or expire after 'ttl'
+        seconds. Once 'maxsize' is reached new keys are rejected, as the entries may still be in use,
+        unless the registry only holds entries that are safe to lose.
+    """
+
+    def __init__(self, name: str, maxsize: int = 10_000, ttl: Optional[float] = 600,
+                 evict_oldest: bool = False) -> None:
+        """
+        Args:
+            name: Name used in logs and gauges.
+            maxsize: Maximum number of entries kept.
+            ttl: Seconds after which an entry is evicted, or None to only bound by size.
+            evict_oldest: Evict the oldest entry instead of rejecting new keys when full,
+                for entries that can be recomputed, e.g. cached responses.
+        """
+        if maxsize <= 0:
+            raise ValueError("'maxsize' must be positive.")
+
+        self.name = name
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._evict_oldest = evict_oldest
+
+        self._lock = threading.Lock()
+        # Insertion ordered, so the oldest entries are always first.
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._evictions = 0
+        self._rejections = 0
+
+    def _evict_expired(self, now: float) -> None:
+        if self._ttl is None:
+            return
+        while self._entries:
+            key, (created_at, _) = next(iter(self._entries.items()))
+            if now - created_at < self._ttl:
+                break
+            self._entries.popitem(last=False)
+            self._evictions += 1
+            logging.warning("%s: Entry '%s' expired.", self.name, key)
+
+    def set(self, key: K, value: V) -> None:
+        """
+        Raises:
+            RegistryFullError: If the registry is full and doesn't evict its oldest entries.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            if key not in self._entries and len(self._entries) >= self._maxsize:
+                if not self._evict_oldest:
+                    self._rejections += 1
+                    raise RegistryFullError(f"{self.name}: Registry is full.")
+                evicted, _ = self._entries.popitem(last=False)
+                self._evictions += 1
+                logging.warning(
+                    "%s: Entry '%s' evicted, registry is full.", self.name, evicted)
+            self._entries.pop(key, None)
+            self._entries[key] = (now, value)
+
+    def full(self) -> bool:
+        """ Whether a new key would be rejected. """
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            return not self._evict_oldest and len(self._entries) >= self._maxsize
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            entry = self._entries.get(key)
+        return default if entry is None else entry[1]
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def discard(self, key: K, value: V) -> None:
+        """ Removes the entry only if it still holds 'value', e.g. a completed future
+            whose key was reused by a redelivered message.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is value:
+                del self._entries[key]
+
+    def values(self) -> List[V]:
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            return [value for _, value in self._entries.values()]
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def gauges(self) -> Dict[str, int]:
+        return {f"{self.name}.size": len(self._entries),
+                f"{self.name}.evictions": self._evictions,
+                f"{self.name}.rejections": self._rejections}
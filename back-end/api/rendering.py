@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import html
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from string import Template
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict
+
+from api.exceptions import InvalidTemplate
+from api.sections import split_sections
+from api.tasks import TaskResponse
+
+__doc__ = """ Renders optimized resumes into downloadable PDF or HTML documents from named templates.
+            Rendering runs in a process pool, and documents are cached by content hash, template and format. """
+
+# Parsed resume content, (heading, text) pairs. Plain tuples so it is cheap to send to the pool.
+Content = Tuple[Tuple[str, str], ...]
+
+FORMATS = {"pdf": "application/pdf", "html": "text/html"}
+
+
+class ResumeTemplate(BaseModel):
+    # Frozen, so a template is hashable and its compiled form can be cached in every worker.
+    model_config = ConfigDict(frozen=True)
+
+    id: str
+    name: str
+    font: str = "Helvetica"
+    heading_font: str = "Helvetica-Bold"
+    font_size: float = 10
+    accent: str = "#000000"
+
+
+TEMPLATES = {template.id: template for template in [
+    ResumeTemplate(id="classic", name="Classic",
+                   font="Times-Roman", heading_font="Times-Bold", font_size=11),
+    ResumeTemplate(id="modern", name="Modern", accent="#1f6feb"),
+    ResumeTemplate(id="compact", name="Compact", font_size=8.5, accent="#444444"),
+]}
+
+_HTML_DOCUMENT = Template("""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>$title</title><style>
+body { font-family: $font; font-size: ${font_size}pt; max-width: 48em; margin: 2em auto; }
+h1, h2 { font-family: $heading_font; color: $accent; }
+h2 { border-bottom: 1px solid $accent; }
+p { margin: 0.2em 0; }
+</style></head><body>
+$body
+</body></html>""")
+
+_CSS_FONTS = {"Times": "'Times New Roman', serif",
+              "Helvetica": "Helvetica, Arial, sans-serif",
+              "Courier": "'Courier New', monospace"}
+
+
+def _css_font(font: str) -> str:
+    return _CSS_FONTS.get(font.split('-')[0], "sans-serif")
+
+
+@lru_cache(maxsize=None)
+def _compile_html(template: ResumeTemplate) -> Template:
+    """ Fills the template styles once, leaving only the resume content to substitute. """
+    document = _HTML_DOCUMENT.safe_substitute(
+        font=_css_font(template.font),
+        heading_font=_css_font(template.heading_font),
+        font_size=template.font_size,
+        accent=template.accent
+    )
+    return Template(document)
+
+
+@lru_cache(maxsize=None)
+def _compile_pdf(template: ResumeTemplate) -> Dict:
+    """ Builds the paragraph styles of a template once per process. """
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.styles import ParagraphStyle
+
+    body = ParagraphStyle(f"{template.id}-body", fontName=template.font,
+                          fontSize=template.font_size, leading=template.font_size * 1.3)
+    heading = ParagraphStyle(f"{template.id}-heading", parent=body,
+                             fontName=template.heading_font, fontSize=template.font_size * 1.3,
+                             leading=template.font_size * 1.7, spaceBefore=template.font_size,
+                             textColor=HexColor(template.accent))
+    title = ParagraphStyle(f"{template.id}-title", parent=heading,
+                           fontSize=template.font_size * 2, leading=template.font_size * 2.4,
+                           spaceBefore=0)
+    return {"body": body, "heading": heading, "title": title}
+
+
+def _blocks(content: Content):
+    """ Yields (kind, text) blocks. The first line of a leading section without heading,
+        usually the name, becomes the title.
+    """
+    for heading, text in content:
+        if heading:
+            yield "heading", heading
+        elif text:
+            title, _, text = text.partition('\n')
+            yield "title", title
+        for line in text.split('\n'):
+            if line.strip():
+                yield "body", line.strip()
+
+
+def _render_html(template: ResumeTemplate, content: Content) -> bytes:
+    tags = {"title": "h1", "heading": "h2", "body": "p"}
+    blocks = [f"<{tags[kind]}>{html.escape(text)}</{tags[kind]}>"
+              for kind, text in _blocks(content)]
+    title = next((text for kind, text in _blocks(content) if kind == "title"), "Resume")
+
+    document = _compile_html(template).substitute(
+        title=html.escape(title), body="\n".join(blocks))
+    return document.encode('utf-8')
+
+
+def _render_pdf(template: ResumeTemplate, content: Content) -> bytes:
+    from io import BytesIO
+
+    from reportlab.lib.pagesizes import LETTER
+    from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+    styles = _compile_pdf(template)
+    flowables = [Paragraph(html.escape(text), styles[kind])
+                 for kind, text in _blocks(content)]
+
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize=LETTER, title="Resume").build(flowables)
+    return buffer.getvalue()
+
+
+def render_document(template: ResumeTemplate, content: Content, fmt: str) -> bytes:
+    """ Renders one document. Runs in the worker processes, so it must stay a module-level function. """
+    if fmt == "pdf":
+        return _render_pdf(template, content)
+    return _render_html(template, content)
+
+
+class DocumentRenderer:
+    """ Renders task responses with the registered templates.
+        Parsed resumes and rendered documents are kept in LRU caches, and concurrent requests
+        for the same document share one render.
+    """
+
+    def __init__(self, templates: Iterable[ResumeTemplate] = None, max_workers: int = None,
+                 cache_size: int = 256, content_cache_size: int = 128) -> None:
+        """
+        Args:
+            templates: The available templates, the built-in ones by default.
+            max_workers: Size of the process pool, the number of CPUs by default.
+            cache_size: Number of rendered documents kept.
+            content_cache_size: Number of parsed resumes kept.
+        """
+        if cache_size <= 0 or content_cache_size <= 0:
+            raise ValueError("Cache sizes must be positive.")
+
+        self._templates = {template.id: template
+                           for template in (templates or TEMPLATES.values())}
+        self._max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        self._cache_size = cache_size
+        self._content_cache_size = content_cache_size
+        self._documents: OrderedDict[Tuple[str, str, str], bytes] = OrderedDict()
+        self._contents: OrderedDict[str, Content] = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+    @property
+    def templates(self) -> List[ResumeTemplate]:
+        return list(self._templates.values())
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Forking would copy the event loop and the gRPC threads of the API process.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    mp_context=multiprocessing.get_context("forkserver"))
+            return self._pool
+
+    def _parse(self, text: str) -> Tuple[str, Content]:
+        """ Returns the content hash and parsed sections of a resume, parsing it only once. """
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            content = self._contents.get(digest)
+            if content is not None:
+                self._contents.move_to_end(digest)
+                return digest, content
+
+        content = tuple((section.heading, section.text)
+                        for section in split_sections(text))
+        with self._lock:
+            self._contents[digest] = content
+            while len(self._contents) > self._content_cache_size:
+                self._contents.popitem(last=False)
+        return digest, content
+
+    def _cached(self, key: Tuple[str, str, str]) -> Optional[bytes]:
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+            return document
+
+    def _store(self, key: Tuple[str, str, str], document: bytes) -> None:
+        with self._lock:
+            self._documents[key] = document
+            while len(self._documents) > self._cache_size:
+                self._documents.popitem(last=False)
+
+    async def render(self, response: TaskResponse, template_id: str, fmt: str = "pdf") -> bytes:
+        """ Renders the optimized resume of a task response.
+
+        Args:
+            response: The response of a resume optimization task.
+            template_id: The id of a registered template.
+            fmt: The document format, 'pdf' or 'html'.
+
+        Returns:
+            The rendered document.
+
+        Raises:
+            InvalidTemplate: If the template or the format is unknown.
+            KeyError: If the response has no 'response' text.
+        """
+        template = self._templates.get(template_id)
+        if template is None:
+            raise InvalidTemplate(f"Template '{template_id}' not found.")
+        if fmt not in FORMATS:
+            raise InvalidTemplate(f"Format '{fmt}' not supported.")
+
+        digest, content = self._parse(response.payload["response"])
+        key = (digest, template_id, fmt)
+        document = self._cached(key)
+        if document is not None:
+            return document
+
+        future = self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._get_pool(), render_document, template, content, fmt)
+            self._in_flight[key] = future
+            future.add_done_callback(partial(self._rendered, key))
+        # Shielded, so a cancelled request doesn't cancel a render other requests wait on.
+        return await asyncio.shield(future)
+
+    def _rendered(self, key: Tuple[str, str, str], future: asyncio.Future) -> None:
+        self._in_flight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        document = future.result()
+        self._store(key, document)
+        logging.info(
+            "Rendered '%s' %s document: %d bytes.", key[1], key[2], len(document))
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import List
+
+__doc__ = """ Orders the execution of consumed tasks so short and urgent ones don't wait behind large resumes. """
+
+
+class _Waiter:
+    __slots__ = ('priority', 'cost', 'enqueued_at', 'future')
+
+    def __init__(self, priority: int, cost: int, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+        self.future = future
+
+
+class TaskScheduler:
+    """ Grants a fixed number of execution slots by priority class, then shortest estimated job first.
+        Waiting tasks age, so a large job gets ahead of newer small ones once it has waited long enough.
+    """
+
+    def __init__(self, concurrency: int = 4, priority_weight: float = 10_000,
+                 aging_rate: float = 500) -> None:
+        """
+        Args:
+            concurrency: Number of tasks allowed to run at the same time.
+            priority_weight: Cost, in estimated tokens, equivalent to one priority class.
+            aging_rate: Estimated tokens discounted from a task's cost for each second it waits.
+        """
+        if concurrency <= 0:
+            raise ValueError("'concurrency' must be positive.")
+
+        self._concurrency = concurrency
+        self._priority_weight = priority_weight
+        self._aging_rate = aging_rate
+
+        self._running = 0
+        self._pending: List[_Waiter] = []
+
+    def _score(self, waiter: _Waiter, now: float) -> float:
+        waited = now - waiter.enqueued_at
+        return (waiter.priority * self._priority_weight + waiter.cost
+                - self._aging_rate * waited)
+
+    def _wake_next(self) -> None:
+        while self._running < self._concurrency and self._pending:
+            now = time.monotonic()
+            waiter = min(self._pending, key=lambda w: self._score(w, now))
+            self._pending.remove(waiter)
+            if waiter.future.done():  # Cancelled while waiting
+                continue
+            self._running += 1
+            waiter.future.set_result(None)
+
+    async def acquire(self, priority: int = 1, cost: int = 0) -> None:
+        """ Waits until the task is granted an execution slot.
+
+        Args:
+            priority: Priority class, lower runs first.
+            cost: Estimated cost of the task, such as its prompt token count.
+        """
+        if self._running < self._concurrency and not self._pending:
+            self._running += 1
+            return
+
+        waiter = _Waiter(priority, cost,
+                         asyncio.get_running_loop().create_future())
+        self._pending.append(waiter)
+        logging.debug(
+            "TaskScheduler: %d tasks waiting for a slot.", len(self._pending))
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._pending:
+                self._pending.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # The slot was granted right before cancellation
+            raise
+
+    def release(self) -> None:
+        """ Frees a slot taken by 'acquire' and hands it to the best pending task. """
+        self._running -= 1
+        self._wake_next()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> int:
+        return self._running
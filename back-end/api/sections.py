@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+__doc__ = """ Splits resume text into sections and remembers the optimized version of each one,
+            so a resubmitted resume only sends its changed sections to the executors. """
+
+SECTION_HEADINGS = {
+    'summary', 'profile', 'objective', 'about me', 'contact', 'contact information',
+    'experience', 'work experience', 'professional experience', 'employment history',
+    'education', 'skills', 'technical skills', 'projects', 'certifications',
+    'languages', 'awards', 'publications', 'volunteering', 'interests', 'references'
+}
+
+_HEADING_PATTERN = re.compile(r'^[\W_]*([A-Za-z][A-Za-z &/]{1,40}?)[\s:\-_]*$')
+# Markdown emphasis and heading marks, e.g. '**Experience**' or '## Education', as models answer in markdown.
+_MARKDOWN_PATTERN = re.compile(r'[*_#`]+')
+
+
+class ResumeSection(BaseModel):
+    heading: str
+    text: str
+
+    @property
+    def digest(self) -> str:
+        """ Content hash identifying this exact version of the section. """
+        content = f"{self.heading}\n{self.text}".encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+
+def _as_heading(line: str) -> Optional[str]:
+    match = _HEADING_PATTERN.match(_MARKDOWN_PATTERN.sub('', line).strip())
+    if not match:
+        return None
+    heading = match.group(1).strip()
+    return heading if heading.lower() in SECTION_HEADINGS else None
+
+
+def split_sections(text: str) -> List[ResumeSection]:
+    """ Splits resume text on known section headings.
+        Anything before the first heading, usually the name and contact details, becomes a section without heading.
+    """
+    sections = []
+    heading, lines = '', []
+    for line in text.splitlines():
+        new_heading = _as_heading(line)
+        if new_heading is None:
+            lines.append(line)
+            continue
+
+        if heading or ''.join(lines).strip():
+            sections.append(ResumeSection(
+                heading=heading, text='\n'.join(lines).strip()))
+        heading, lines = new_heading, []
+
+    if heading or ''.join(lines).strip():
+        sections.append(ResumeSection(
+            heading=heading, text='\n'.join(lines).strip()))
+    return sections
+
+
+class SectionCache:
+    """ Keeps the optimized sections of the latest submission of each lineage.
+        A lineage is a token or a document id; only the most recently used 'maxsize' lineages are kept.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize <= 0:
+            raise ValueError("'maxsize' must be positive.")
+
+        self._lock = threading.Lock()
+        self._lineage_to_sections: OrderedDict[str, Dict[str, str]] = OrderedDict()
+        self._maxsize = maxsize
+
+    def get(self, lineage: str) -> Dict[str, str]:
+        """ Returns a copy of the section digest to optimized text mapping of the last submission. """
+        with self._lock:
+            sections = self._lineage_to_sections.get(lineage)
+            if sections is None:
+                return {}
+            self._lineage_to_sections.move_to_end(lineage)
+            return dict(sections)
+
+    def set(self, lineage: str, sections: Dict[str, str]) -> None:
+        """ Replaces the sections of a lineage, dropping the ones no longer in the resume. """
+        with self._lock:
+            self._lineage_to_sections[lineage] = dict(sections)
+            self._lineage_to_sections.move_to_end(lineage)
+            while len(self._lineage_to_sections) > self._maxsize:
+                evicted, _ = self._lineage_to_sections.popitem(last=False)
+                logging.debug("SectionCache: Evicted lineage '%s'.", evicted)
+
+    def __len__(self) -> int:
+        return len(self._lineage_to_sections)
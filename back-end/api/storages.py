@@ -78,16 +78,16 @@ class DictStorage(TaskResponseStorage):
 
         async with self._lock:
             self._id_to_result_queue.update({request_id: queue})
-        logging.info(
-            f"DictStorage.create: Created queue for ID: '{request_id}'.")
+        logging.debug(
+            "DictStorage.create: Created queue for ID: '%s'.", request_id)
 
     async def read(self, request_id: str):
-        logging.info(f"DictStorage.read: Reading from ID: '{request_id}'.")
+        logging.debug("DictStorage.read: Reading from ID: '%s'.", request_id)
         async with self._lock:
-            logging.info(
-                f"DictStorage.read: Acquired _lock for '{request_id}'.")
+            logging.debug(
+                "DictStorage.read: Acquired _lock for '%s'.", request_id)
             queue = self._id_to_result_queue.get(request_id, None)
-        logging.info(f"DictStorage.read: Released _lock for '{request_id}'.")
+        logging.debug("DictStorage.read: Released _lock for '%s'.", request_id)
 
         if not queue:
             raise NotFoundError(f"Result queue for ID {request_id} not found.")
@@ -96,11 +96,11 @@ class DictStorage(TaskResponseStorage):
             result = await queue.get()
         except RetryError:
             logging.exception(
-                f"DictStorage.read: Timeout waiting for result from ID: '{request_id}'.")
+                "DictStorage.read: Timeout waiting for result from ID: '%s'.", request_id)
             raise
         except Exception as e:
             logging.exception(
-                "DictStorage.read: Unexpected exception:", str(e))
+                "DictStorage.read: Unexpected exception: %s", e)
             raise e
 
         queue.task_done()
@@ -118,7 +118,7 @@ class DictStorage(TaskResponseStorage):
             KeyError: If the result queue for the given ID does not exist.
             QueueFull: If the result queue for the given ID is full. 
         """
-        logging.info(f"DictStorage.update: Updating for ID: '{request_id}'.")
+        logging.debug("DictStorage.update: Updating for ID: '%s'.", request_id)
 
         if not isinstance(raw_data, TaskResponse):
             try:
@@ -126,34 +126,34 @@ class DictStorage(TaskResponseStorage):
 
             except ValidationError:
                 logging.exception(
-                    f"DictStorage.update: Invalid TaskResponse received from ID: {request_id}:\n{raw_data}")
+                    "DictStorage.update: Invalid TaskResponse received from ID: %s:\n%r", request_id, raw_data)
                 raise ValidationError(
                     f"Invalid TaskResponse received from ID: {request_id}")
         else:
             data = raw_data
 
         async with self._lock:
-            logging.info(
-                f"DictStorage.update: Acquiring _lock for ID: '{request_id}'.")
+            logging.debug(
+                "DictStorage.update: Acquiring _lock for ID: '%s'.", request_id)
             if request_id not in self._id_to_result_queue:
                 logging.exception(
-                    f"DictStorage.update: Result queue for ID {request_id} not found.")
+                    "DictStorage.update: Result queue for ID %s not found.", request_id)
                 raise NotFoundError(
                     f"Result queue for ID {request_id} not found.")
             # Avoid modification when acessing it
             queue = self._id_to_result_queue[request_id]
-        logging.info(
-            f"DictStorage.update: Released _lock for ID: '{request_id}'.")
+        logging.debug(
+            "DictStorage.update: Released _lock for ID: '%s'.", request_id)
 
         if queue.full():
             logging.warning(
-                f"DictStorage.update: Attempting to update '{request_id}' which already has a response.")
+                "DictStorage.update: Attempting to update '%s' which already has a response.", request_id)
             raise RedundantResponseError(
                 f"Result queue for ID {request_id} is full.")
 
         queue.put_nowait(data)
-        logging.info(
-            f"DictStorage.update: Updated 'TaskResponse' for ID: '{request_id}'.")
+        logging.debug(
+            "DictStorage.update: Updated 'TaskResponse' for ID: '%s'.", request_id)
 
     async def delete(self, request_id: str) -> None:
         """ Removes the result queue associated with the given ID.
@@ -164,14 +164,14 @@ class DictStorage(TaskResponseStorage):
         Raises:
             KeyError: If the result queue for the given ID does not exist.
         """
-        logging.info(f"DictStorage.delete: Deleting from ID: '{request_id}'.")
+        logging.debug("DictStorage.delete: Deleting from ID: '%s'.", request_id)
         async with self._lock:
             if request_id not in self._id_to_result_queue:
                 logging.warning(
-                    f"Tried to remove result queue for ID {request_id}, but it doesn't exist.")
+                    "Tried to remove result queue for ID %s, but it doesn't exist.", request_id)
                 raise NotFoundError(
                     f"Result queue for ID {request_id} not found.")
 
             self._id_to_result_queue.pop(request_id)
-        logging.info(
-            f"DictStorage.delete: Deleted queue for ID: '{request_id}'.")
+        logging.debug(
+            "DictStorage.delete: Deleted queue for ID: '%s'.", request_id)
@@ -1,41 +1,73 @@
 import asyncio
 import logging
+import os
 import uuid
 from asyncio import QueueFull
 from functools import partial
 from threading import Lock
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict
 
 from dependency_injector import containers, providers
 from dependency_injector.wiring import Provide, inject
 from pydantic import ValidationError
 
-from api.exceptions import (InvalidTaskName, UnableToFetchResultError,
-                         UnableToPublishTask)
+from api import task_queue
+from api.exceptions import (InvalidTaskName, RateLimitExceeded,
+                            ServiceOverloaded, UnableToFetchResultError,
+                            UnableToPublishTask)
+from api.rate_limiters import InMemoryRateLimiter, UpstashRateLimiter
 from api.storages import DictStorage, TaskResponseStorage
 from api.task_queue import GooglePubSubTaskPublisher
 from api.tasks import TaskRequest, TaskResponse
 from api.utils import exp_backoff
 
 
+async def init_task_publisher(shutdown_timeout: float) -> AsyncIterator[GooglePubSubTaskPublisher]:
+    """ Creates the publisher on first use and drains it when the resources are shut down. """
+    publisher = GooglePubSubTaskPublisher()
+    yield publisher
+    await publisher.shutdown(timeout=shutdown_timeout)
+
+
 class Container(containers.DeclarativeContainer):
     config = providers.Configuration()
-    queue = providers.ThreadSafeSingleton(GooglePubSubTaskPublisher)
+    queue = providers.Resource(
+        init_task_publisher,
+        shutdown_timeout=float(os.getenv('SHUTDOWN_TIMEOUT', 25))
+    )
     result_storage = providers.ThreadSafeSingleton(DictStorage)
+    rate_limiter = providers.Selector(
+        lambda: os.getenv('RATE_LIMITER', 'memory'),
+        memory=providers.ThreadSafeSingleton(
+            InMemoryRateLimiter,
+            limit=int(os.getenv('RATE_LIMIT', 10)),
+            period=float(os.getenv('RATE_LIMIT_PERIOD', 60)),
+            max_concurrent=int(os.getenv('MAX_CONCURRENT_TASKS', 2)),
+            task_ttl=float(os.getenv('TASK_TTL', 300))
+        ),
+        upstash=providers.ThreadSafeSingleton(
+            UpstashRateLimiter,
+            limit=int(os.getenv('RATE_LIMIT', 10)),
+            period=float(os.getenv('RATE_LIMIT_PERIOD', 60)),
+            max_concurrent=int(os.getenv('MAX_CONCURRENT_TASKS', 2)),
+            task_ttl=float(os.getenv('TASK_TTL', 300))
+        )
+    )
 
 
 @inject
 async def request_task(request: Dict,
                        storage=Provide[Container.result_storage],
                        queue=Provide[Container.queue],
-                       timeout: float = 5, tries: int = 5) -> Dict:
+                       rate_limiter=Provide[Container.rate_limiter],
+                       timeout: float = float(os.getenv('TASK_TIMEOUT', 60))) -> Dict:
     """ Requests a task from the queue and waits for the result.
     Args:
         request: A dictionary containing the task request.  Must include 'auth' and 'task_name' keys.
         storage: The ResultStorage instance to use.  Injected via dependency injection.
         queue: The TaskQueue instance to use. Injected via dependency injection.
-        timeout: The timeout for waiting for the result.
-        tries: The number of retries to attempt before giving up.
+        rate_limiter: The RateLimiter keyed by the request 'auth'. Injected via dependency injection.
+        timeout: Maximum number of seconds to wait for the result.
 
     Returns:
         A dictionary containing the task result.
@@ -44,11 +76,13 @@ async def request_task(request: Dict,
         TypeError: If the request is not a dictionary.
         ValidationError: If the request is invalid.
         KeyError: If a required key is missing from the request.
-        UnableToFetchResultError: If the result cannot be fetched after multiple retries.
+        RateLimitExceeded: If the token exceeded its quota or has too many tasks in flight.
+        ServiceOverloaded: If too many tasks are already waiting, the client should retry later.
+        UnableToFetchResultError: If the result cannot be fetched before the timeout.
         Exception: For any other unexpected errors.
     """
 
-    logging.debug(f"Current request: {request}")
+    logging.debug("Current request: %s", request)
     if not isinstance(request, dict):
         raise TypeError("Request must be a dictionary.")
 
@@ -71,33 +105,67 @@ async def request_task(request: Dict,
     auth = request_obj.auth
     task_name = request_obj.task_name
 
-    await storage.create(request_id)
+    try:
+        slot = await rate_limiter.acquire(auth)
+    except RateLimitExceeded:
+        logging.warning("Request rejected by rate limiter. Auth: %s", auth)
+        raise
 
     try:
+        await storage.create(request_id)
         await queue.publish_task(request_obj, storage)
+    except ServiceOverloaded:
+        logging.warning(
+            "Request rejected, service overloaded. Auth: %s, Request ID: %s", auth, request_id)
+        raise
     except UnableToPublishTask as e:
         logging.exception(
-            f"Unable to publish task. Auth: {auth}, Request ID: {request_id}")
+            "Unable to publish task. Auth: %s, Request ID: %s", auth, request_id)
         raise e
 
     else:
         try:
-            result = await storage.read(request_id)
-            logging.info("Request sucessfully handled.")
+            # Bounded, so a lost task releases its rate limiter slot.
+            result = await asyncio.wait_for(storage.read(request_id), timeout)
+            logging.info("Request %s sucessfully handled.", request_id)
+        except asyncio.TimeoutError:
+            raise UnableToFetchResultError(
+                f"No result was received within {timeout}s.")
         except Exception as e:
             raise UnableToFetchResultError(
-                "After several tries the system was unable to fetch results.", str(e))
+                "The system was unable to fetch results.", str(e))
 
     finally:
         try:
             await storage.delete(request_id)
         except Exception as e:
-            logging.exception(f"Unable to delete {request_id}.", str(e))
+            logging.exception("Unable to delete %s: %s", request_id, e)
             pass
+        await rate_limiter.release(auth, slot)
 
     return result
 
 
+async def shutdown_tasks() -> None:
+    """ Drains the task publisher if it was ever created. Call it once, when the app stops. """
+    logging.info("Shutting down task publisher...")
+    pending = container.shutdown_resources()
+    if pending is not None:
+        await pending
+
+
+def reload_topics() -> None:
+    """ Reloads the task topics config, e.g. on SIGHUP. The current topics are kept when it is invalid. """
+    try:
+        if container.queue.initialized:
+            # An initialized async resource resolves to a finished future.
+            container.queue().result().reload_topics()
+        else:
+            task_queue.cont.topic_manager().reload()
+    except (OSError, ValueError) as e:
+        logging.error("Unable to reload topics, keeping the current ones: %s", e)
+
+
 container = Container()
 container.wire(modules=[__name__])
 
@@ -134,5 +202,6 @@ if __name__ == "__main__":
             end = time.time()
             print(
                 f"Total time taken {n} requests: {end - start:.4f} seconds. AVG time per req: {(end - start) / n:.6f} seconds")
+        await shutdown_tasks()
 
     asyncio.run(main())
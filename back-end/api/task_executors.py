@@ -1,38 +1,114 @@
+import asyncio
 import logging
 import os
 from abc import ABC, abstractmethod
+from typing import List, Optional
 
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class TaskExecutor(ABC):
     @abstractmethod
-    def is_available():
+    def is_available(self) -> bool:
         raise NotImplementedError
 
     @abstractmethod
-    def run_task(task):
+    async def run_task(self, task) -> str:
         raise NotImplementedError
 
 
+# Versions of google-generativeai whose private client API '_keyed_model' was checked against.
+_GENAI_VERSIONS = ("0.8.",)
+
+
+def _keyed_model(model_name: str, api_key: str):
+    """ Creates a GenerativeModel that calls Gemini with its own async client and API key.
+        The library only configures one global key, so this is the one place relying on its private API.
+
+    Raises:
+        RuntimeError: If the installed google-generativeai wasn't checked against this helper.
+    """
+    import google.generativeai as genai
+    from google.generativeai import client
+
+    if not genai.__version__.startswith(_GENAI_VERSIONS):
+        raise RuntimeError(
+            f"google-generativeai {genai.__version__} is not supported by the API key pool, "
+            f"expected {' or '.join(v + 'x' for v in _GENAI_VERSIONS)}.")
+
+    # Builds the client the way the library builds its default one, user agent included.
+    manager = client._ClientManager()
+    manager.configure(api_key=api_key)
+    model = genai.GenerativeModel(model_name)
+    model._async_client = manager.make_client("generative_async")
+    return model
+
+
+class _GeminiKey:
+    """ One API key of the pool, with its own model, connection and concurrency cap. """
+
+    def __init__(self, api_key: Optional[str], model_name: str, max_concurrency: int) -> None:
+        self.api_key = api_key
+        self.model_name = model_name
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self._model = None
+
+    def model(self):
+        # Created on first use so the gRPC channel binds to the running event loop.
+        if self._model is None:
+            if self.api_key:
+                self._model = _keyed_model(self.model_name, self.api_key)
+            else:
+                import google.generativeai as genai
+                self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+
 class Gemini(TaskExecutor):
-    def __init__(self):
-        if not os.getenv('GEMINI_API_KEY') and not os.getenv('DEBUG'):
-            raise Exception("GEMINI_API_KEY not found in environment variables.")
-        api_key = os.getenv('GEMINI_API_KEY')
+    def __init__(self, api_keys: List[str] = None, model_name: str = "gemini-1.5-flash",
+                 max_concurrency_per_key: int = None):
+        """
+        Args:
+            api_keys: Keys to spread the load across. Defaults to the comma separated
+                'GEMINI_API_KEYS' or to 'GEMINI_API_KEY'.
+            model_name: The Gemini model used by every key.
+            max_concurrency_per_key: Maximum number of calls in flight per key. Defaults to 'GEMINI_MAX_CONCURRENCY' or 4.
+        """
+        if api_keys is None:
+            api_keys = [key.strip() for key in os.getenv('GEMINI_API_KEYS', '').split(',')
+                        if key.strip()]
+            if not api_keys and os.getenv('GEMINI_API_KEY'):
+                api_keys = [os.getenv('GEMINI_API_KEY')]
 
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-flash")
+        if not api_keys:
+            if not os.getenv('DEBUG'):
+                raise Exception("GEMINI_API_KEY not found in environment variables.")
+            api_keys = [None]  # Falls back to the library's default credentials
+
+        if max_concurrency_per_key is None:
+            max_concurrency_per_key = int(os.getenv('GEMINI_MAX_CONCURRENCY', 4))
+
+        self._keys = [_GeminiKey(key, model_name, max_concurrency_per_key)
+                      for key in api_keys]
+        logging.info("Gemini executor using %d API keys.", len(self._keys))
 
     def is_available(self) -> bool:
-        return True
+        return bool(self._keys)
 
-    def run_task(self, task) -> str:
+    async def run_task(self, task) -> str:
         if not self.is_available():
             raise Exception("Gemini API is not available.")
 
-        response = self.model.generate_content(task.to_prompt())
-        logging.info(f"Executed task: {task}")
+        # Least loaded key first, callers wait on its semaphore when every key is at its cap.
+        key = min(self._keys, key=lambda k: k.in_flight)
+        key.in_flight += 1
+        try:
+            async with key.semaphore:
+                response = await key.model().generate_content_async(task.to_prompt())
+        finally:
+            key.in_flight -= 1
+
+        logging.debug("Executed task: %s", task)
         return response.text
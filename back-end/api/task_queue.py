@@ -1,22 +1,36 @@
 import asyncio
+import concurrent.futures
 import functools
+import json
 import logging
 import os
 import threading
+import time
+import uuid
 from abc import ABC, abstractmethod
 from asyncio import AbstractEventLoop
-from typing import Callable, Dict, Set, Tuple
+from contextlib import asynccontextmanager
+from typing import (TYPE_CHECKING, Callable, Coroutine, Dict, Optional, Set,
+                    Tuple)
 
 from dependency_injector import containers, providers
 from dependency_injector.wiring import Provide, inject
 from dotenv import load_dotenv
-from google.cloud.pubsub_v1 import PublisherClient, SubscriberClient
-from google.cloud.pubsub_v1.subscriber.message import Message
-
-from api.exceptions import InvalidTaskName, UnableToPublishTask
-from api.storages import TaskResponseStorage
+from pydantic import BaseModel, Field, ValidationError
+
+from api.exceptions import (InvalidTaskName, RegistryFullError,
+                            ServiceOverloaded, UnableToPublishTask)
+from api.idempotency import (InMemoryProcessedIdStore, ProcessedIdStore,
+                             UpstashProcessedIdStore)
+from api.registries import BoundedRegistry
+from api.schedulers import TaskScheduler
+from api.storages import RedundantResponseError, TaskResponseStorage
 from api.tasks import TaskManager, TaskRequest, TaskResponse
 from api.utils import exp_backoff, exp_sleep
+from api.wire_codecs import WireCodec
+
+if TYPE_CHECKING:
+    from google.cloud.pubsub_v1.subscriber.message import Message
 
 load_dotenv()
 
@@ -27,7 +41,11 @@ class TaskQueue(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def publish(message: str, *args, **kwargs):
+    def publish(message: bytes, *args, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def shutdown(self, timeout: float):
         raise NotImplementedError
 
 
@@ -43,42 +61,159 @@ class TaskQueuePublisher(ABC):
     ):
         raise NotImplementedError
 
+    @abstractmethod
+    async def shutdown(self, timeout: float):
+        raise NotImplementedError
+
+
+# Messages leased per executor slot by default. TASK_CONCURRENCY caps how many tasks run, and
+# the leases beyond it wait in the scheduler, which can only reorder the tasks it holds.
+LEASES_PER_SLOT = 4
+
+
+class TopicConfig(BaseModel):
+    topic: str
+    subscription: str
+    # Maximum number of messages each consumer of the subscription leases at once, running
+    # or waiting for a scheduler slot. Defaults to LEASES_PER_SLOT times TASK_CONCURRENCY.
+    concurrency: Optional[int] = Field(default=None, gt=0)
+
+
+# Prototype for development, used when no config file is given.
+DEFAULT_TOPICS = {
+    "test-task": TopicConfig(topic="test-topic", subscription="test-sub"),
+    "resume-optimization": TopicConfig(topic="test-topic", subscription="test-sub")
+}
+
+
+# Response attribute the per-instance response subscriptions filter on.
+REPLY_KEY = "reply_key"
+
+
+class ReplyRoute(BaseModel):
+    """ Where an API instance receives the responses of the tasks run by standalone workers.
+        Pub/Sub hands each message of a subscription to only one of its subscribers, so every
+        instance has its own subscription to the shared response topic, filtered on its key.
+    """
+    topic: str
+    subscription: str
+    key: str
+
+    @classmethod
+    def for_instance(cls, topic: str, subscription: str, instance_id: str = None) -> 'ReplyRoute':
+        """
+        Args:
+            topic: The response topic shared by every instance.
+            subscription: Prefix of the instance's subscription name.
+            instance_id: Stable ID of the instance, so a restart reuses its subscription. Random when omitted.
+        """
+        key = instance_id or uuid.uuid4().hex[:12]
+        return cls(topic=topic, subscription=f"{subscription}-{key}", key=key)
+
+    @property
+    def filter(self) -> str:
+        return f'attributes.{REPLY_KEY} = "{self.key}"'
+
 
 class GooglePubSubTopicManager:
-    """ Manages Google Pub/Sub topics and subscriptions for tasks. """
+    """ Manages Google Pub/Sub topics and subscriptions for tasks.
+        Giving each task its own subscription and concurrency keeps a backlog of slow tasks
+        from delaying quick ones. The mapping is read from a JSON file of task names to
+        topic configs, e.g. {"resume-optimization": {"topic": "resume-topic",
+        "subscription": "resume-sub", "concurrency": 2}}, and can be reloaded at runtime.
+    """
+
+    def __init__(self, config_path: str = None, task_concurrency: int = 4) -> None:
+        """
+        Args:
+            config_path: Path of the JSON config file. The development topics are used when omitted.
+            task_concurrency: Executor slots of the scheduler. Subscriptions without a concurrency
+                lease LEASES_PER_SLOT times as many messages, so tasks queue up to be reordered.
 
-    def __init__(self) -> None:
-        self.task_name_to_topic_sub_pair: Dict[str, Tuple[str, str]] = {
-            "test-task": ("test-topic", "test-sub"),
-            "resume-optimization": ("test-topic", "test-sub")
-        }  # Prototype for development
+        Raises:
+            OSError: If the config file can't be read.
+            ValueError: If the config file is invalid.
+        """
+        self._config_path = config_path
+        self._default_concurrency = LEASES_PER_SLOT * task_concurrency
+        self._task_name_to_config = self._with_defaults(DEFAULT_TOPICS)
+        self.reload()
+
+    def reload(self) -> None:
+        """ Reads the config file again. The current topics are kept when it fails.
+
+        Raises:
+            OSError: If the config file can't be read.
+            ValueError: If the config file is invalid.
+        """
+        if not self._config_path:
+            return
+
+        with open(self._config_path, encoding='utf-8') as f:
+            raw = json.load(f)
+        if not isinstance(raw, dict):
+            raise ValueError("Topics config must map task names to topic configs.")
+        configs = self._with_defaults({task_name: TopicConfig.model_validate(config)
+                                       for task_name, config in raw.items()})
+
+        # Swapped as a whole, so readers never see a partially loaded config.
+        self._task_name_to_config = configs
+        logging.info(
+            "Loaded topics of %d tasks from '%s'.", len(configs), self._config_path)
+
+    def _with_defaults(self, configs: Dict[str, TopicConfig]) -> Dict[str, TopicConfig]:
+        return {task_name: config if config.concurrency else
+                config.model_copy(update={"concurrency": self._default_concurrency})
+                for task_name, config in configs.items()}
+
+    def get_topic_config(self, task_name: str) -> TopicConfig:
+        """Retrieves the topic config for a given task name."""
+        config = self._task_name_to_config.get(task_name)
+        if not config:
+            raise InvalidTaskName(f"Task name '{task_name}' not found.")
+        return config
 
     def get_topic_sub_pair(self, task_name: str) -> Tuple[str, str]:
         """Retrieves the topic and subscription pair for a given task name."""
-        pair = self.task_name_to_topic_sub_pair.get(task_name)
-        if not pair:
-            raise InvalidTaskName(f"Task name '{task_name}' not found.")
-        return pair
+        config = self.get_topic_config(task_name)
+        return config.topic, config.subscription
+
+    def get_subscriptions(self) -> Dict[str, int]:
+        """Retrieves every subscription tasks are consumed from, with its concurrency.
+        Tasks sharing a subscription share its highest concurrency."""
+        subscriptions = {}
+        for config in self._task_name_to_config.values():
+            subscriptions[config.subscription] = max(
+                config.concurrency, subscriptions.get(config.subscription, 0))
+        return subscriptions
 
 
-class GooglePubSubRequestCallback:
-    """ Handles callbacks from Google Pub/Sub subscriptions. """
+class GooglePubSubCallback(ABC):
+    """ Base class for Google Pub/Sub subscription callbacks.
+        Keeps track of the storages waiting for each request ID and of the coroutines
+        scheduled on the event loop, so they can be drained on shutdown.
+    """
 
     def __init__(
         self,
         loop: AbstractEventLoop,
-        task_manager: TaskManager
+        codec: WireCodec = None,
+        maxsize: int = 10_000,
+        storage_ttl: float = 600
     ) -> None:
+        self._codec = codec or WireCodec()
 
-        self._id_to_storage_lock = asyncio.Lock()
-        self._id_to_storage = {}
+        # Entries leave on response; the TTL covers requests whose response never arrives.
+        self._id_to_storage: BoundedRegistry[str, TaskResponseStorage] = BoundedRegistry(
+            "callback.storages", maxsize=maxsize, ttl=storage_ttl)
+        # Running tasks always complete, so they are only bounded by size.
+        self._futures: BoundedRegistry[str, concurrent.futures.Future] = BoundedRegistry(
+            "callback.futures", maxsize=maxsize, ttl=None)
+        # Only '_submit' adds futures, so checking for room and adding one can't race.
+        self._submit_lock = threading.Lock()
+        self._accepting = True
 
-        self._futures_lock = threading.Lock()
-        self._futures = {}
-
-        self._task_manager = task_manager
-        if not loop:
-            self._loop = asyncio.get_running_loop()
+        self._loop = loop or asyncio.get_running_loop()
 
     async def set_storage_to_id(
         self,
@@ -94,156 +229,410 @@ class GooglePubSubRequestCallback:
                 "Parameter 'storage' must be derived from 'TaskResponseStorage'."
             )
 
-        async with self._id_to_storage_lock:
-            self._id_to_storage[request_id] = storage
-        logging.info(f"Successfully associated storage with ID: {request_id}.")
+        # Raises RegistryFullError rather than dropping a storage still waiting for its response.
+        self._id_to_storage.set(request_id, storage)
+        logging.debug("Successfully associated storage with ID: %s.", request_id)
+
+    async def _update_storage(
+        self,
+        storage: TaskResponseStorage,
+        result: TaskResponse,
+        message: 'Message'
+    ) -> None:
+        try:
+            logging.debug("Updating storage for ID: %s.", result.id)
+            await storage.update(result.id, result)
+        except RedundantResponseError:
+            logging.exception(
+                "Redundant response received for ID: %s.", result.id)
+            message.ack()
+        except Exception as e:
+            logging.exception(
+                "%s._update_storage: Error updating storage for ID: %s: %s",
+                self.__class__.__name__, result.id, e)
+            message.ack()
+        else:
+            message.ack()
+            logging.info("Message with ID: %s was sent to storage.", result.id)
+        finally:
+            # Whatever the outcome, nothing else will be delivered to this storage.
+            self._id_to_storage.discard(result.id, storage)
+
+    def _cleanup_future(self, future, request_id: str):
+        self._futures.discard(request_id, future)
+
+    def _submit(self, coro: Coroutine, request_id: str, message: 'Message') -> None:
+        """ Runs a coroutine on the event loop from the subscriber thread.
+            The message is nacked instead when too many are already running.
+        """
+        with self._submit_lock:
+            if self._futures.full():
+                coro.close()
+                logging.warning(
+                    "Too many tasks running, message with ID: %s was nacked.", request_id)
+                message.nack()
+                return
+            future = asyncio.run_coroutine_threadsafe(coro, loop=self._loop)
+            self._futures.set(request_id, future)
+
+        future.add_done_callback(
+            functools.partial(self._cleanup_future, request_id=request_id)
+        )
+
+    async def drain(self, timeout: float) -> bool:
+        """ Stops accepting messages and waits for the tasks already running.
+
+        Messages received after this call are nacked so Pub/Sub redelivers them to another instance.
+
+        Args:
+            timeout: Maximum number of seconds to wait for in-flight tasks.
+
+        Returns:
+            True if every in-flight task finished before the deadline.
+        """
+        self._accepting = False
+        futures = self._futures.values()
+
+        if not futures:
+            return True
+
+        logging.info("Waiting for %d in-flight tasks...", len(futures))
+        _, pending = await asyncio.wait(
+            [asyncio.wrap_future(future) for future in futures],
+            timeout=timeout
+        )
+        if pending:
+            logging.warning(
+                "%d tasks were still running after %ss. Their messages will be redelivered.",
+                len(pending), timeout)
+        return not pending
+
+    def gauges(self) -> Dict[str, int]:
+        return {**self._id_to_storage.gauges(), **self._futures.gauges()}
+
+    @abstractmethod
+    def __call__(self, message: 'Message') -> None:
+        raise NotImplementedError
+
+
+class GooglePubSubRequestCallback(GooglePubSubCallback):
+    """ Executes the TaskRequests of a subscription in this process.
+        Each request ID runs at most once at a time and redeliveries of processed
+        requests reuse the stored response, so they never reach the executors.
+    """
+
+    def __init__(
+        self,
+        loop: AbstractEventLoop,
+        task_manager: TaskManager,
+        scheduler: TaskScheduler,
+        codec: WireCodec = None,
+        processed_ids: ProcessedIdStore = None,
+        ack_deadline: int = 60,
+        heartbeat_interval: float = None
+    ) -> None:
+        """
+        Args:
+            loop: The event loop tasks run on, the running one when None.
+            task_manager: Runs the tasks.
+            scheduler: Orders the tasks waiting for an executor.
+            codec: Decodes the requests.
+            processed_ids: Claims request IDs and keeps their responses, in memory by default.
+            ack_deadline: Seconds the ack deadline of a running task's message is extended by, from 10 to 600 as Pub/Sub allows.
+            heartbeat_interval: Seconds between two extensions, half of 'ack_deadline' by default.
+
+        Raises:
+            ValueError: If 'ack_deadline' or 'heartbeat_interval' is out of range.
+        """
+        if not 10 <= ack_deadline <= 600:
+            raise ValueError("'ack_deadline' must be between 10 and 600 seconds.")
+        if heartbeat_interval is None:
+            heartbeat_interval = ack_deadline / 2
+        if not 0 < heartbeat_interval < ack_deadline:
+            raise ValueError("'heartbeat_interval' must be positive and below 'ack_deadline'.")
+
+        super().__init__(loop, codec)
+        self._task_manager = task_manager
+        self._scheduler = scheduler
+        self._processed_ids = processed_ids or InMemoryProcessedIdStore()
+        self._ack_deadline = int(ack_deadline)
+        self._heartbeat_interval = heartbeat_interval
+
+    async def _run_task(self, request: TaskRequest) -> TaskResponse:
+        """ Waits for a scheduler slot and runs the task.
+            Micro-batched tasks run right away, as their batch takes one slot for all of them.
+        """
+        if self._task_manager.batched(request):
+            logging.info("Processing request %s in a micro-batch...", request.id)
+            result = await self._task_manager.process_task(request)
+        else:
+            priority, cost = self._task_manager.estimate(request)
+            await self._scheduler.acquire(priority=priority, cost=cost)
+            try:
+                logging.info("Processing request %s...", request.id)
+                result = await self._task_manager.process_task(request)
+            finally:
+                self._scheduler.release()
+        # The result is only formatted when debug logs are on, and truncated in production.
+        logging.debug("Task %s result: %s.", request.id, result)
+        return result
+
+    @asynccontextmanager
+    async def _keep_alive(self, request_id: str, message: 'Message'):
+        """ Extends the message's ack deadline and the request's claim until the block exits,
+            so a slow task isn't redelivered while it is still running.
+        """
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(self._heartbeat_interval)
+                try:
+                    message.modify_ack_deadline(self._ack_deadline)
+                    await self._processed_ids.extend(request_id)
+                except Exception as e:
+                    logging.warning(
+                        "Unable to extend the deadline of %s: %s", request_id, e)
+
+        task = asyncio.create_task(heartbeat())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    async def _run_once(self, request: TaskRequest, message: 'Message') -> Optional[TaskResponse]:
+        """ Runs the task of a request unless another delivery of it already did.
+
+        Returns:
+            The response, stored by a previous delivery or just computed.
+            None when another delivery is still running it or it can't be claimed; the message was nacked.
+
+        Raises:
+            Exception: Whatever the task raised. The claim is released and the message nacked, so it can be retried.
+        """
+        try:
+            claim = await self._processed_ids.claim(request.id)
+        except RegistryFullError:
+            logging.warning(
+                "Too many requests claimed, message with ID: %s was nacked.", request.id)
+            message.nack()
+            return None
+        if claim.result is not None:
+            logging.info(
+                "Request %s was already processed, reusing its response.", request.id)
+            return claim.result
+        if not claim.acquired:
+            logging.info(
+                "Request %s is running elsewhere, message was nacked.", request.id)
+            message.nack()
+            return None
+
+        try:
+            async with self._keep_alive(request.id, message):
+                result = await self._run_task(request)
+        except BaseException:
+            await self._processed_ids.release(request.id)
+            message.nack()
+            raise
+
+        await self._processed_ids.complete(request.id, result)
+        return result
 
     async def _execute_task(
         self,
         request_id: str,
         request: TaskRequest,
-        message: Message
+        message: 'Message'
     ) -> None:
-        logging.debug(
-            f"GooglePubSub._update_storage: \
-                id = {request_id}, \
-                result = {request}, \
-                message: {message}."
-        )
+        logging.debug("%s._execute_task: id = %s, task = %s.",
+                      self.__class__.__name__, request_id, request.task_name)
         if not self._loop.is_running():
             message.nack()
             raise RuntimeError("Event loop is closed.")
 
-        async with self._id_to_storage_lock:
-            storage = self._id_to_storage.get(request_id)
+        storage = self._id_to_storage.get(request_id)
 
         if storage is None:
-            logging.warning(f"No storage found for ID: {request_id}.")
+            logging.warning("No storage found for ID: %s.", request_id)
             message.ack()  # Try again later
             return
 
-        logging.info(f"Processing request {request_id}...")
-        result = self._task_manager.process_task(request)
-        logging.info(f"Task {request_id} result: {result.model_dump_json()}.")
+        result = await self._run_once(request, message)
+        if result is not None:
+            await self._update_storage(storage, result, message)
+
+    def __call__(self, message: 'Message') -> None:
+        logging.debug("Callback received message of %d bytes.", len(message.data))
+
+        if not self._accepting:
+            logging.info("Shutting down, message was nacked.")
+            message.nack()
+            return
 
         try:
-            logging.info(f"Updating storage for ID: {request_id}.")
-            await storage.update(request_id, result.model_dump_json())
-        except RedundantResponseError:
-            logging.exception(
-                f"Redundant response received for ID: {request_id}.")
-            message.ack()
-        except Exception as e:
-            logging.exception(
-                f"{self.__class__.__name__}._update_storage: Error updating storage for ID: {request_id}: {e}")
-            message.ack()
-        else:
+            request = self._codec.decode(
+                message.data, message.attributes, TaskRequest)
+        except (ValidationError, ValueError):
+            logging.exception("Invalid TaskRequest format: %r", message.data)
             message.ack()
-            logging.info(f"Message with ID: {result.id} was sent to storage.")
+            return
 
-    def _cleanup_future(self, message, request_id: str):
-        with self._futures_lock:
-            self._futures.pop(request_id)
+        self._submit(self._execute_task(request.id, request, message), request.id, message)
 
-    def __call__(self, message: Message) -> None:
-        logging.info(f"Callback received message: {message.data}.")
 
-        try:
-            request = TaskRequest.model_validate_json(message.data)
-        except ValidationError:
-            logging.exception(f"Invalid TaskRequest format: {message.data}")
+class GooglePubSubResponseCallback(GooglePubSubCallback):
+    """ Hands the TaskResponses published by workers to the storage waiting for them. """
+
+    async def _receive_response(
+        self,
+        result: TaskResponse,
+        message: 'Message'
+    ) -> None:
+        storage = self._id_to_storage.get(result.id)
+
+        if storage is None:
+            # The subscription only gets this instance's responses, so the request already timed out.
+            logging.warning("No storage found for ID: %s.", result.id)
             message.ack()
             return
 
-        future = asyncio.run_coroutine_threadsafe(
-            self._execute_task(request.id, request, message),
-            loop=self._loop
-        )
+        await self._update_storage(storage, result, message)
 
-        with self._futures_lock:
-            self._futures[request.id] = future
+    def __call__(self, message: 'Message') -> None:
+        logging.debug("Callback received message of %d bytes.", len(message.data))
 
-        future.add_done_callback(
-            functools.partial(self._cleanup_future, request_id=request.id)
-        )
+        if not self._accepting:
+            logging.info("Shutting down, message was nacked.")
+            message.nack()
+            return
+
+        try:
+            result = self._codec.decode(
+                message.data, message.attributes, TaskResponse)
+        except (ValidationError, ValueError):
+            logging.exception("Invalid TaskResponse format: %r", message.data)
+            message.ack()
+            return
+
+        self._submit(self._receive_response(result, message), result.id, message)
 
 
 class GooglePubSub(TaskQueue):
-    def __init__(self, project: str = None):
+    def __init__(
+        self,
+        project: str = None,
+        pub_client=None,
+        consumer_client=None,
+        maxsize: int = 10_000,
+        pub_ttl: float = 600
+    ):
         self._project = project
         if not self._project:
             raise ValueError("Project ID must be provided.")
 
-        self._pub_client = PublisherClient()
-        self._consumer_client = SubscriberClient()
+        if pub_client is None or consumer_client is None:
+            # Imported here so the clients are only paid for once a task is published.
+            from google.cloud.pubsub_v1 import (PublisherClient,
+                                                SubscriberClient)
+            pub_client = pub_client or PublisherClient()
+            consumer_client = consumer_client or SubscriberClient()
 
-        self._lock_pub_pool = threading.Lock()
-        self._pub_pool = {}
+        self._pub_client = pub_client
+        self._consumer_client = consumer_client
+
+        # Futures leave once published; the TTL is a safety net for ones that never resolve.
+        self._pub_pool: BoundedRegistry[str, concurrent.futures.Future] = BoundedRegistry(
+            "pubsub.publish_futures", maxsize=maxsize, ttl=pub_ttl)
 
         self._lock_consumer_pool = threading.Lock()
         # One consumer per subscription.  There is a low fixed amount of consumers.
         self._consumer_pool = {}
+        # Subscriptions created for this process only, deleted on shutdown.
+        self._temporary_subscriptions: Set[str] = set()
 
-    def _cleanup_pub_future(self, message, key, topic):
-        with self._lock_pub_pool:
-            # This will always return a future
-            future = self._pub_pool.get(key)
+    def _cleanup_pub_future(self, future, key, topic):
+        self._pub_pool.discard(key, future)
 
         try:
             message_id = future.result()
 
         except Exception as e:
             logging.exception(
-                f"Error processing future for key {key}: {e}. Resuming publish..."
-            )
-            self._pub_client.resume_publish(topic, message_id)
+                "Error publishing message for key %s to topic '%s': %s.", key, topic, e)
         else:
-            logging.info(
-                f"Future for message ID: '{message_id}' was successfully published."
-            )
+            logging.debug(
+                "Future for message ID: '%s' was successfully published.", message_id)
 
-    def _cleanup_sub_future(self, message, key):
+    def _cleanup_sub_future(self, future, key):
         with self._lock_consumer_pool:
-            self._consumer_pool.pop(key)
+            # Only if it wasn't already replaced by a new consumer of the same subscription.
+            if self._consumer_pool.get(key, (None,))[0] is future:
+                del self._consumer_pool[key]
         logging.info(f"Subscription '{key}' was successfully cancelled.")
 
-    def publish(self, message: str, topic: str, request_id: str, tries=3) -> None:
+    def publish(
+        self,
+        message: bytes,
+        topic: str,
+        request_id: str,
+        attributes: Dict[str, str] = None
+    ) -> concurrent.futures.Future:
+        """ Publishes a message and returns the future resolved once Pub/Sub confirms it.
+
+        Raises:
+            ServiceOverloaded: If too many publishes are waiting for confirmation.
+        """
+        if self._pub_pool.full():
+            raise ServiceOverloaded("Too many publishes are waiting for confirmation.")
+
         topic_name = 'projects/{project}/topics/{topic}'.format(
             project=self._project,
             topic=topic,
         )
 
-        future = self._pub_client.publish(topic_name, message.encode(
-            'utf-8'))  # This has internal retries and timeout
+        future = self._pub_client.publish(
+            topic_name, message, **(attributes or {}))  # This has internal retries and timeout
         logging.info(
-            f"Message with ID: {request_id} was sent to topic: '{topic}'.")
+            "Message with ID: %s was sent to topic: '%s'.", request_id, topic)
 
-        with self._lock_pub_pool:
-            self._pub_pool[request_id] = future
+        self._pub_pool.set(request_id, future)
 
         future.add_done_callback(
             functools.partial(self._cleanup_pub_future, key=request_id, topic=topic))
+        return future
 
-    def consume(self, subscription: str, callback: Callable) -> None:
+    def consume(self, subscription: str, callback: Callable, concurrency: int = None) -> None:
+        """ Starts a consumer of the subscription, unless it already has one with the same concurrency.
+
+        Args:
+            subscription: The subscription to pull from.
+            callback: Called with every message, on the subscriber's threads.
+            concurrency: Maximum number of messages leased at once, the client default when None.
+        """
         with self._lock_consumer_pool:
             # One kind of task has a specific consumer running, there is a low fixed amount of consumers.
-            if subscription in self._consumer_pool:
-                logging.info(
-                    f"This subscription {subscription} is already being listened to."
-                )
+            current = self._consumer_pool.get(subscription)
+        if current is not None:
+            if current[1] == concurrency:
+                logging.debug(
+                    "This subscription %s is already being listened to.", subscription)
                 return
+            logging.info(
+                "Concurrency of '%s' changed to %s, restarting its consumer.",
+                subscription, concurrency)
+            self.cancel(subscription)
 
         logging.info(f"Consuming from '{subscription}'...")
-        subscription_name = 'projects/{project}/subscriptions/{sub}'.format(
-            project=self._project,
-            sub=subscription
-        )
+        subscription_name = self._subscription_name(subscription)
+
+        kwargs = {}
+        if concurrency is not None:
+            from google.cloud.pubsub_v1.types import FlowControl
+            kwargs["flow_control"] = FlowControl(max_messages=concurrency)
 
         future = self._consumer_client.subscribe(
-            subscription_name, callback)  # This runs on a separate thread
+            subscription_name, callback, **kwargs)  # This runs on a separate thread
 
         with self._lock_consumer_pool:
-            self._consumer_pool[subscription] = future
+            self._consumer_pool[subscription] = (future, concurrency)
 
         future.add_done_callback(
             functools.partial(self._cleanup_sub_future, key=subscription)
@@ -253,19 +642,177 @@ class GooglePubSub(TaskQueue):
         logging.info(
             f"Listening to messages of subscription: '{subscription}'.")
 
+    def _subscription_name(self, subscription: str) -> str:
+        return 'projects/{project}/subscriptions/{sub}'.format(
+            project=self._project,
+            sub=subscription
+        )
+
+    def create_subscription(
+        self,
+        subscription: str,
+        topic: str,
+        filter: str = None,
+        temporary: bool = False,
+        expire_after: int = 24 * 3600
+    ) -> None:
+        """ Creates a subscription to a topic, unless it already exists.
+        This blocks, so call it from a thread when running on an event loop.
+
+        Args:
+            subscription: The subscription to create.
+            topic: The topic it receives the messages of.
+            filter: Pub/Sub filter on the message attributes, e.g. 'attributes.key = "value"'.
+            temporary: Deletes the subscription on shutdown.
+            expire_after: Seconds without subscribers after which Pub/Sub deletes the subscription,
+                so the ones left by crashed instances go away. One day at least.
+        """
+        from google.api_core.exceptions import AlreadyExists
+
+        request = {
+            "name": self._subscription_name(subscription),
+            "topic": 'projects/{project}/topics/{topic}'.format(
+                project=self._project, topic=topic),
+            "expiration_policy": {"ttl": {"seconds": expire_after}},
+        }
+        if filter:
+            request["filter"] = filter
+        try:
+            self._consumer_client.create_subscription(request=request)
+            logging.info("Subscription '%s' to topic '%s' was created.", subscription, topic)
+        except AlreadyExists:
+            logging.info("Subscription '%s' already exists.", subscription)
+
+        if temporary:
+            with self._lock_consumer_pool:
+                self._temporary_subscriptions.add(subscription)
+
+    def cancel(self, subscription: str) -> None:
+        """ Stops consuming a subscription. Its unacked messages are redelivered. """
+        with self._lock_consumer_pool:
+            current = self._consumer_pool.pop(subscription, None)
+        if current is not None:
+            current[0].cancel()
+
+    def subscriptions(self) -> Set[str]:
+        """ Subscriptions with a running consumer. """
+        with self._lock_consumer_pool:
+            return set(self._consumer_pool)
+
+    def gauges(self) -> Dict[str, int]:
+        with self._lock_consumer_pool:
+            subscriptions = len(self._consumer_pool)
+        return {**self._pub_pool.gauges(), "pubsub.subscriptions": subscriptions}
+
+    def shutdown(self, timeout: float = 30) -> None:
+        """ Cancels every streaming pull and flushes the pending publishes.
+        This blocks, so call it from a thread when running on an event loop.
+
+        Args:
+            timeout: Maximum number of seconds to wait in total.
+        """
+        deadline = time.monotonic() + timeout
+
+        with self._lock_consumer_pool:
+            consumers = [(subscription, future)
+                         for subscription, (future, _) in self._consumer_pool.items()]
+        for subscription, future in consumers:
+            future.cancel()
+            try:
+                future.result(timeout=max(0, deadline - time.monotonic()))
+            except concurrent.futures.CancelledError:
+                pass
+            except Exception:
+                logging.exception(
+                    "Subscription '%s' did not stop cleanly.", subscription)
+
+        with self._lock_consumer_pool:
+            temporary, self._temporary_subscriptions = self._temporary_subscriptions, set()
+        for subscription in temporary:
+            try:
+                self._consumer_client.delete_subscription(
+                    request={"subscription": self._subscription_name(subscription)},
+                    timeout=max(0, deadline - time.monotonic()))
+                logging.info("Subscription '%s' was deleted.", subscription)
+            except Exception:
+                logging.exception(
+                    "Unable to delete subscription '%s', it expires on its own.", subscription)
+        self._consumer_client.close()
+
+        # Sends the outstanding batches and rejects any further publish.
+        self._pub_client.stop()
+        futures = self._pub_pool.values()
+        _, pending = concurrent.futures.wait(
+            futures, timeout=max(0, deadline - time.monotonic())
+        )
+        if pending:
+            logging.warning(
+                "%d messages were not confirmed before shutdown.", len(pending))
+        logging.info("Google Pub/Sub clients were shut down.")
+
 
 class Container(containers.DeclarativeContainer):
     queue = providers.ThreadSafeSingleton(
         GooglePubSub,
         project=os.getenv("GOOGLE_CLOUD_PROJECT")
     )
-    callback = providers.ThreadSafeSingleton(
-        GooglePubSubRequestCallback,
-        loop=None,
-        task_manager=TaskManager()
+    codec = providers.ThreadSafeSingleton(
+        WireCodec,
+        codec=os.getenv("WIRE_CODEC", "json"),
+        compress_threshold=int(os.getenv("WIRE_COMPRESS_THRESHOLD", 16 * 1024))
+    )
+    task_concurrency = providers.Object(int(os.getenv("TASK_CONCURRENCY", 4)))
+    scheduler = providers.ThreadSafeSingleton(
+        TaskScheduler,
+        concurrency=task_concurrency
+    )
+    # Micro-batches take their scheduler slot once collected, one per batch.
+    task_manager = providers.ThreadSafeSingleton(TaskManager, scheduler=scheduler)
+    # With a response topic, tasks run on standalone workers ('python -m api.worker')
+    # and this process only listens to their responses, on a subscription of its own.
+    reply_to = providers.Object(
+        ReplyRoute.for_instance(
+            os.getenv("RESPONSE_TOPIC"),
+            os.getenv("RESPONSE_SUBSCRIPTION", "responses"),
+            os.getenv("INSTANCE_ID")
+        )
+        if os.getenv("RESPONSE_TOPIC") else None
+    )
+    processed_ids = providers.Selector(
+        lambda: os.getenv("PROCESSED_ID_STORE", "memory"),
+        memory=providers.ThreadSafeSingleton(
+            InMemoryProcessedIdStore,
+            ttl=float(os.getenv("PROCESSED_ID_TTL", 3600)),
+            lease=float(os.getenv("PROCESSED_ID_LEASE", 120))
+        ),
+        upstash=providers.ThreadSafeSingleton(
+            UpstashProcessedIdStore,
+            ttl=int(os.getenv("PROCESSED_ID_TTL", 3600)),
+            lease=int(os.getenv("PROCESSED_ID_LEASE", 120))
+        )
+    )
+    ack_deadline = providers.Object(int(os.getenv("ACK_DEADLINE", 60)))
+    callback = providers.Selector(
+        lambda: "worker" if os.getenv("RESPONSE_TOPIC") else "inline",
+        inline=providers.ThreadSafeSingleton(
+            GooglePubSubRequestCallback,
+            loop=None,
+            task_manager=task_manager,
+            scheduler=scheduler,
+            codec=codec,
+            processed_ids=processed_ids,
+            ack_deadline=ack_deadline
+        ),
+        worker=providers.ThreadSafeSingleton(
+            GooglePubSubResponseCallback,
+            loop=None,
+            codec=codec
+        )
     )
     topic_manager = providers.ThreadSafeSingleton(
-        GooglePubSubTopicManager
+        GooglePubSubTopicManager,
+        config_path=os.getenv("TOPICS_CONFIG"),
+        task_concurrency=task_concurrency
     )
 
 
@@ -277,7 +824,9 @@ class GooglePubSubTaskPublisher(TaskQueuePublisher):
         self,
         queue: GooglePubSub = Provide[Container.queue],
         topic_manager: GooglePubSubTopicManager = Provide[Container.topic_manager],
-        callback: GooglePubSubRequestCallback = Provide[Container.callback],
+        callback: GooglePubSubCallback = Provide[Container.callback],
+        reply_to: Optional[ReplyRoute] = Provide[Container.reply_to],
+        codec: WireCodec = Provide[Container.codec],
     ) -> None:
 
         if not (queue or topic_manager or callback):
@@ -288,6 +837,10 @@ class GooglePubSubTaskPublisher(TaskQueuePublisher):
         super().__init__(queue)
         self._topic_manager = topic_manager
         self._callback = callback
+        self._reply_to = reply_to
+        self._reply_subscribed = False
+        self._codec = codec
+        self._closed = False
 
     async def publish_task(
         self,
@@ -302,9 +855,13 @@ class GooglePubSubTaskPublisher(TaskQueuePublisher):
             tries: The number of retries to attempt if publishing fails.
         Raises:
             ValueError: If the message or storage is invalid.
-            UnableToPublishTask: If publishing fails after multiple retries.
+            UnableToPublishTask: If publishing fails after multiple retries or the publisher is shutting down.
+            ServiceOverloaded: If too many tasks are already waiting for a response or a publish confirmation.
         """
 
+        if self._closed:
+            raise UnableToPublishTask("Publisher is shutting down.")
+
         if not isinstance(message, TaskRequest):
             raise ValueError(
                 "'message' argument must be derived from TaskRequest."
@@ -316,9 +873,7 @@ class GooglePubSubTaskPublisher(TaskQueuePublisher):
             )
 
         try:
-            topic, sub = self._topic_manager.get_topic_sub_pair(
-                message.task_name
-            )
+            config = self._topic_manager.get_topic_config(message.task_name)
 
         except InvalidTaskName:
             logging.critical(
@@ -328,13 +883,80 @@ class GooglePubSubTaskPublisher(TaskQueuePublisher):
             )
             raise
 
-        logging.info(
-            f"Publishing task '{message.task_name}' with ID '{message.id}' to topic '{topic}'."
-        )
-        await self._callback.set_storage_to_id(storage, message.id)
+        topic, sub = config.topic, config.subscription
+        # Tasks sharing a subscription share its highest concurrency, like on the workers,
+        # as consuming it with another concurrency restarts the pull and redelivers its messages.
+        concurrency = self._topic_manager.get_subscriptions().get(sub, config.concurrency)
+        logging.debug("Publishing task '%s' with ID '%s' to topic '%s'.",
+                      message.task_name, message.id, topic)
+        if self._reply_to and not self._reply_subscribed:
+            await self._subscribe_to_replies()
+        try:
+            await self._callback.set_storage_to_id(storage, message.id)
+        except RegistryFullError as e:
+            raise ServiceOverloaded("Too many tasks are waiting for a response.") from e
+
+        if self._reply_to:
+            # Workers execute the task and answer with this instance's key on the response topic.
+            sub = self._reply_to.subscription
+            concurrency = None  # Responses are cheap to handle
+            message = message.model_copy(update={"reply_to": self._reply_to.topic,
+                                                 "reply_key": self._reply_to.key})
+
+        data, attributes = self._codec.encode(message)
+        self._queue.publish(data, topic, message.id, attributes)
+        self._queue.consume(sub, self._callback, concurrency)
+
+    async def _subscribe_to_replies(self) -> None:
+        """ Creates this instance's response subscription, filtered on its key. """
+        try:
+            await asyncio.to_thread(
+                self._queue.create_subscription,
+                self._reply_to.subscription,
+                self._reply_to.topic,
+                filter=self._reply_to.filter,
+                temporary=True
+            )
+        except Exception as e:
+            raise UnableToPublishTask("Unable to create the response subscription.") from e
+        self._reply_subscribed = True
+
+    def reload_topics(self) -> None:
+        """ Reloads the topics config. When tasks run inline, the task subscriptions
+            it no longer has stop being consumed.
+
+        Raises:
+            OSError: If the config file can't be read.
+            ValueError: If the config file is invalid.
+        """
+        self._topic_manager.reload()
+        if self._reply_to:
+            return  # Only the response subscription is consumed
+
+        configured = self._topic_manager.get_subscriptions()
+        for sub in self._queue.subscriptions() - configured.keys():
+            logging.info("Subscription '%s' is no longer configured.", sub)
+            self._queue.cancel(sub)
 
-        self._queue.publish(message.model_dump_json(), topic, message.id)
-        self._queue.consume(sub, self._callback)
+    def gauges(self) -> Dict[str, int]:
+        """ Sizes of the bookkeeping maps, to watch for leaks on long-running instances. """
+        return {**self._queue.gauges(), **self._callback.gauges()}
+
+    async def shutdown(self, timeout: float = 30) -> None:
+        """ Drains the publisher before the process exits.
+        New tasks are refused, in-flight tasks get until the deadline to finish,
+        then the subscriptions are cancelled and pending publishes are flushed.
+
+        Args:
+            timeout: Maximum number of seconds the whole drain may take.
+        """
+        deadline = time.monotonic() + timeout
+        self._closed = True
+
+        await self._callback.drain(timeout=timeout)
+        await asyncio.to_thread(
+            self._queue.shutdown, max(0, deadline - time.monotonic())
+        )
 
 
 cont = Container()
@@ -1,70 +1,150 @@
 import asyncio
+import functools
 import logging
-from abc import ABC, abstractmethod
+import os
+import time
+from asyncio import AbstractEventLoop
+from typing import TYPE_CHECKING
 
-from tasks import Task, TaskRequest, TaskResponse
+from dependency_injector import providers
 
-__doc__ = """ This module intends to define basic classes, methods and objects necessary to handle TaskRequest incoming from TaskQueues and process them.  
-            It also defines the TaskResponse to be sent back to the TaskQueue after processing. 
+from api import task_queue
+from api.idempotency import ProcessedIdStore
+from api.schedulers import TaskScheduler
+from api.task_queue import (REPLY_KEY, GooglePubSub,
+                            GooglePubSubRequestCallback,
+                            GooglePubSubTopicManager)
+from api.tasks import TaskManager, TaskRequest
+from api.wire_codecs import CONTENT_TYPE, WireCodec
+
+if TYPE_CHECKING:
+    from google.cloud.pubsub_v1.subscriber.message import Message
+
+__doc__ = """ This module intends to define basic classes, methods and objects necessary to handle TaskRequest incoming from TaskQueues and process them.
+            It also defines the TaskResponse to be sent back to the TaskQueue after processing.
             It also should orchestrate the TaskExecutors to process the tasks respecting API rate limits. """
 
 
-class TaskOrchestrator:
-    """ Orchestrates the execution of tasks by TaskExecutors, respecting rate limits """
+class TaskOrchestrator(GooglePubSubRequestCallback):
+    """ Executes TaskRequests pulled by a standalone worker and publishes the
+        TaskResponse to the topic named in the request's 'reply_to'.
+    """
+
+    def __init__(
+        self,
+        loop: AbstractEventLoop,
+        task_manager: TaskManager,
+        scheduler: TaskScheduler,
+        queue: GooglePubSub,
+        codec: WireCodec = None,
+        processed_ids: ProcessedIdStore = None,
+        ack_deadline: int = 60,
+        heartbeat_interval: float = None
+    ) -> None:
+
+        super().__init__(loop, task_manager, scheduler, codec,
+                         processed_ids, ack_deadline, heartbeat_interval)
+        self._queue = queue
 
-    # in seconds
-    def __init__(self, executors: list[TaskExecutor], rate_limit: int = 10, rate_limit_period: int = 60):
-        self.executors = executors
-        self.rate_limit = rate_limit
-        self.rate_limit_period = rate_limit_period
-        self.semaphore = asyncio.Semaphore(rate_limit)
-        self.logger = logging.getLogger(__name__)
+    async def _execute_task(
+        self,
+        request_id: str,
+        request: TaskRequest,
+        message: 'Message'
+    ) -> None:
+        if request.reply_to is None:
+            # Published by an API running tasks inline, which may still consume it.
+            logging.warning(
+                "Request %s has no 'reply_to' topic, message was nacked.", request_id)
+            message.nack()
+            return
 
-    async def process_task(self, task_request: TaskRequest) -> TaskResponse:
-        """ Processes a single task request """
         try:
-            # Assuming TaskRequest can be converted to Task
-            task = Task(task_request)
-            async with self.semaphore:
-                # selects an executor based on task type or other criteria
-                executor = self._select_executor(task)
-                if executor is None:
-                    self.logger.error(
-                        f"No suitable executor found for task: {task_request}")
-                    return TaskResponse(task_request.id, success=False, error="No suitable executor found")
-
-                response = await executor.execute(task)
-                return response
-        except Exception as e:
-            self.logger.exception(
-                f"Error processing task {task_request.id}: {e}")
-            return TaskResponse(task_request.id, success=False, error=str(e))
-
-    def _select_executor(self, task: Task) -> TaskExecutor:
-        """Selects an appropriate executor for the given task.  This is a placeholder and should be customized."""
-        # Implement your logic to select the appropriate executor here.
-        # For example, you could check the task type or other attributes.
-        if self.executors:
-            # This selects the first executor in the list.  Replace with your logic.
-            return self.executors[0]
-        return None
-
-    async def process_task_queue(self, task_queue: asyncio.Queue[TaskRequest]):
-        """ Processes a queue of task requests """
-        while True:
-            task_request = await task_queue.get()
-            response = await self.process_task(task_request)
-            # Send response back to task queue or other mechanism.  This is a placeholder.
-            print(f"Task {task_request.id} processed with response: {response}")
-            task_queue.task_done()
-
-# Rate Limiter, TaskQueueResponse
-# GooglePubSubRateLimiter, GooglePubSub
-# Probably Only one instance of pubsub that manages publishing and consuming,
-# a method or class for using it to listen to task topics, create/use a callback (No state beyond the publishing futures)
-# async use of publish method as using run_coroutine
-# So I need TaskPublisher, TaskConsumer, both use the correspondant TaskQueue through dependency injection
-# For google pubsub use a TopicManager to store where to send each thing
-# The callbacks shouldn't be too complex, so separating concerns to a queue that handles LLM service execution and seems good.
-# TaskExecutorManager or TaskOrchestrator Which would send use rate limiters and a list of available services, to build a response
-# then, use a TaskPublisher to send it to a topic of interest
+            result = await self._run_once(request, message)
+        except Exception:
+            # '_run_once' nacked the message, so Pub/Sub redelivers it until its retry policy gives up.
+            logging.exception("Request %s failed, message was nacked.", request_id)
+            return
+        if result is None:
+            return
+
+        # A redelivered request gets the stored response again, in case the first one was never sent.
+        # Answer in the format the request came in.
+        data, attributes = self._codec.encode(
+            result, content_type=(message.attributes or {}).get(CONTENT_TYPE))
+        if request.reply_key:
+            # Routes the response to the subscription of the API instance waiting for it.
+            attributes[REPLY_KEY] = request.reply_key
+        try:
+            future = self._queue.publish(data, request.reply_to, request_id, attributes)
+        except Exception:
+            # The response is stored, so the redelivered request publishes it again.
+            logging.exception(
+                "Response for ID: %s couldn't be published, message was nacked.", request_id)
+            message.nack()
+            return
+        # Acked only once Pub/Sub has the response, or it would be lost with the request.
+        future.add_done_callback(functools.partial(
+            self._settle, request_id=request_id, topic=request.reply_to, message=message))
+
+    @staticmethod
+    def _settle(future, request_id: str, topic: str, message: 'Message') -> None:
+        if future.cancelled() or future.exception() is not None:
+            logging.error(
+                "Response for ID: %s wasn't published to topic: '%s', message was nacked.",
+                request_id, topic)
+            message.nack()
+            return
+        message.ack()
+        logging.info("Response for ID: %s was sent to topic: '%s'.", request_id, topic)
+
+    def subscribe(self, topic_manager: GooglePubSubTopicManager) -> None:
+        """ Consumes every configured task subscription with its concurrency,
+            and stops consuming the ones no longer configured, e.g. after a reload.
+        """
+        subscriptions = topic_manager.get_subscriptions()
+        for sub in self._queue.subscriptions() - subscriptions.keys():
+            logging.info("Subscription '%s' is no longer configured.", sub)
+            self._queue.cancel(sub)
+        for sub, concurrency in subscriptions.items():
+            self._queue.consume(sub, self, concurrency)
+
+    async def serve(
+        self,
+        topic_manager: GooglePubSubTopicManager,
+        stop: asyncio.Event,
+        shutdown_timeout: float = 25
+    ) -> None:
+        """ Consumes every task subscription until 'stop' is set, then drains.
+
+        Args:
+            topic_manager: Source of the subscriptions to pull from.
+            stop: Event signalling the worker to shut down.
+            shutdown_timeout: Maximum number of seconds to wait for in-flight tasks and pending publishes.
+        """
+        self.subscribe(topic_manager)
+
+        await stop.wait()
+
+        logging.info("Worker shutting down...")
+        deadline = time.monotonic() + shutdown_timeout
+        await self.drain(timeout=shutdown_timeout)
+        await asyncio.to_thread(
+            self._queue.shutdown, max(0, deadline - time.monotonic())
+        )
+
+
+class Container(task_queue.Container):
+    orchestrator = providers.ThreadSafeSingleton(
+        TaskOrchestrator,
+        loop=None,
+        task_manager=task_queue.Container.task_manager,
+        scheduler=task_queue.Container.scheduler,
+        queue=task_queue.Container.queue,
+        codec=task_queue.Container.codec,
+        processed_ids=task_queue.Container.processed_ids,
+        ack_deadline=task_queue.Container.ack_deadline
+    )
+    shutdown_timeout = providers.Object(
+        float(os.getenv("SHUTDOWN_TIMEOUT", 25))
+    )
@@ -1,10 +1,16 @@
+import asyncio
+import hashlib
 import json
 import logging
+import os
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, ClassVar, Dict, List, Optional, Tuple
 
 from pydantic import BaseModel, ValidationError
 
+from api.batching import MicroBatcher
+from api.schedulers import TaskScheduler
+from api.sections import ResumeSection, SectionCache, split_sections
 from api.task_executors import Gemini, TaskExecutor
 
 logging.basicConfig(level=logging.INFO)
@@ -13,18 +19,31 @@ logging.basicConfig(level=logging.INFO)
 class Task(BaseModel, ABC):
     prompt: str
     payload: Dict
+    # Scheduling class, lower runs first.
+    priority: ClassVar[int] = 1
+    # Short tasks that may share one call with others of their kind when micro-batching is on.
+    batchable: ClassVar[bool] = False
 
     @abstractmethod
     def to_prompt(self) -> str:
         """ Abstract method to generate the prompt string from the task parameters. """
         raise NotImplementedError
 
+    def estimate_tokens(self) -> int:
+        """ Rough prompt token count, used to schedule short tasks first. """
+        return len(self.to_prompt()) // 4
+
 
 class TaskRequest(BaseModel):
     id: str
     auth: str
     task_name: str
     payload: Dict
+    priority: Optional[int] = None
+    # Topic the response is published to when the task runs on a standalone worker.
+    reply_to: Optional[str] = None
+    # Published with the response, so only the requesting API instance's subscription receives it.
+    reply_key: Optional[str] = None
 
 
 class TaskResponse(BaseModel):
@@ -35,6 +54,8 @@ class TaskResponse(BaseModel):
 class DummyTask(Task):
     prompt: str = "This is a dummy task. {param1}."
     payload: Dict
+    priority: ClassVar[int] = 0
+    batchable: ClassVar[bool] = True
 
     def to_prompt(self) -> str:
         return self.prompt.format(
@@ -49,19 +70,154 @@ class ResumeOptimizationTask(Task):
             Generate a description that sells a reliable, proactive, and hardworking professional."
     payload: Dict[str, Any]
 
+    # Appended when the payload carries a 'job_hint', the target job keywords missing from the resume.
+    job_hint_prompt: ClassVar[str] = "\n\
+            Where truthful, emphasize these keywords from the target job: {job_hint}."
+
     def to_prompt(self) -> str:
-        return self.prompt.format(text=self.payload["text"])
+        return self.prompt.format(text=self.payload["text"]) + self._job_hint()
+
+    def _job_hint(self) -> str:
+        job_hint = self.payload.get("job_hint")
+        return self.job_hint_prompt.format(job_hint=job_hint) if job_hint else ""
+
+
+class ResumeSectionOptimizationTask(ResumeOptimizationTask):
+    prompt: str = "Optimize the '{heading}' section of a resume:\n{text}.\n\
+            Improve all resposabilities descriptions using metrics, correcting grammar and mantaining a professional tone without making the text much larger.\
+            Answer only with the rewritten section, without its heading."
+    payload: Dict[str, Any]
+
+    def to_prompt(self) -> str:
+        return self.prompt.format(heading=self.payload["heading"] or "Header",
+                                  text=self.payload["text"]) + self._job_hint()
 
 
 class TaskManager:
     taskcode_to_task = {"test-task": DummyTask,
                         "resume-optimization": ResumeOptimizationTask}
 
-    def __init__(self):
+    def __init__(self, section_cache: SectionCache = None, micro_batching: bool = None,
+                 scheduler: TaskScheduler = None):
+        if micro_batching is None:
+            micro_batching = bool(os.getenv('MICRO_BATCHING'))
+
         self._executors = [Gemini()]
+        if micro_batching:
+            self._executors = [MicroBatcher(
+                ex,
+                max_batch=int(os.getenv('MICRO_BATCH_SIZE', 8)),
+                max_delay=float(os.getenv('MICRO_BATCH_DELAY', 0.01)),
+                scheduler=scheduler
+            ) for ex in self._executors]
+        self._section_cache = section_cache or SectionCache()
+
+    def batched(self, task_request: TaskRequest) -> bool:
+        """ Whether the request joins a micro-batch, which takes one scheduler slot for all of its
+            tasks. Such requests must not hold a slot of their own while the batch collects.
+        """
+        task_class = self.taskcode_to_task.get(task_request.task_name)
+        if task_class is None or not task_class.batchable:
+            return False
+        ex = next(filter(lambda ex: ex.is_available(), self._executors), None)
+        if not isinstance(ex, MicroBatcher) or ex.scheduler is None:
+            return False
+        try:
+            return ex.batchable(task_class(payload=task_request.payload))
+        except (ValidationError, KeyError):
+            return False
+
+    def estimate(self, task_request: TaskRequest) -> Tuple[int, int]:
+        """ Returns the priority class and estimated token cost used to schedule a request. """
+        task_class = self.taskcode_to_task.get(task_request.task_name)
+        if task_class is None:
+            return 0, 0  # Fails fast in 'process_task'
+
+        priority = task_request.priority
+        if priority is None:
+            priority = task_class.priority
+        try:
+            cost = task_class(payload=task_request.payload).estimate_tokens()
+        except (ValidationError, KeyError):
+            cost = 0
+        return priority, cost
+
+    async def _optimize_sections(self, ex: TaskExecutor, task_request: TaskRequest) -> Dict:
+        """ Optimizes a resume section by section, reusing the sections unchanged since
+            the previous submission of the same lineage ('lineage' payload key or the token).
+            Sections optimized for a different job hint are never reused.
+            When nothing can be reused, the whole resume goes through one 'ResumeOptimizationTask'.
+        """
+        lineage = task_request.payload.get("lineage") or task_request.auth
+        job_hint = task_request.payload.get("job_hint")
+        if job_hint:
+            lineage = f"{lineage}:{hashlib.sha1(job_hint.encode()).hexdigest()[:12]}"
+        sections = split_sections(task_request.payload["text"])
+        previous = self._section_cache.get(lineage)
+
+        optimized, changed_sections = {}, {}
+        for section in sections:
+            digest = section.digest
+            if digest in previous:
+                optimized[digest] = previous[digest]
+            else:
+                changed_sections[digest] = section
+
+        if not any(section.heading for section in sections if section.digest in optimized):
+            # First submission, no known headings, or only the header is unchanged: one call
+            # with the full prompt, as a header alone says nothing about the resume's layout.
+            return await self._optimize_resume(ex, task_request, lineage, sections)
+
+        # Changed sections are independent, so they run concurrently.
+        pending = [
+            asyncio.ensure_future(ex.run_task(ResumeSectionOptimizationTask(
+                payload={**section.model_dump(), "job_hint": job_hint})))
+            for section in changed_sections.values()
+        ]
+        try:
+            results = await asyncio.gather(*pending)
+        except BaseException:
+            # 'gather' leaves the other sections running when one of them fails.
+            for future in pending:
+                future.cancel()
+            raise
+        optimized.update(zip(changed_sections, results))
+
+        changed = len(changed_sections)
+        logging.info(
+            "Optimized %d of %d sections for lineage '%s'.", changed, len(sections), lineage)
+        self._section_cache.set(lineage, optimized)
+
+        text = "\n\n".join(
+            f"{section.heading}\n{optimized[section.digest]}" if section.heading
+            else optimized[section.digest]
+            for section in sections
+        )
+        return {"response": text, "changed_sections": changed}
+
+    async def _optimize_resume(self, ex: TaskExecutor, task_request: TaskRequest,
+                               lineage: str, sections: List[ResumeSection]) -> Dict:
+        """ Optimizes the whole resume in one call and seeds the lineage's cache with the
+            sections of the answer, when its headings line up with the submission's.
+        """
+        text = await ex.run_task(ResumeOptimizationTask(payload=task_request.payload))
+
+        answer = split_sections(text)
+        seeded = {}
+        if ([section.heading.lower() for section in answer if section.heading] ==
+                [section.heading.lower() for section in sections if section.heading]):
+            heading_to_text = {section.heading.lower(): section.text for section in answer}
+            seeded = {section.digest: heading_to_text[section.heading.lower()]
+                      for section in sections if section.heading.lower() in heading_to_text}
+        else:
+            # Reorganized sections can't be told apart, so the next submission runs in full again.
+            logging.info("The answer's sections don't match the resume of lineage '%s'.", lineage)
+        self._section_cache.set(lineage, seeded)
+        logging.info("Optimized the full resume for lineage '%s'.", lineage)
+        return {"response": text, "changed_sections": len(sections)}
 
-    def process_task(self, task_request: TaskRequest) -> TaskResponse:
-        logging.info("Processing task...")
+    async def process_task(self, task_request: TaskRequest) -> TaskResponse:
+        logging.debug("Processing task %s...", task_request.id)
         try:
             task_class = self.taskcode_to_task.get(task_request.task_name)
             if task_class is None:
@@ -70,12 +226,14 @@ class TaskManager:
             ex = next(filter(lambda ex: ex.is_available(), self._executors), None)
             if not ex:
                 raise ValueError("No available executors")
-            logging.info("Found ex.")
+            logging.debug("Running executor %s...", type(ex).__name__)
+            if issubclass(task_class, ResumeOptimizationTask):
+                return TaskResponse(id=task_request.id,
+                                    payload=await self._optimize_sections(ex, task_request))
 
             # Initialize the task with the payload
             task = task_class(payload=task_request.payload)
-            logging.info("Running Executor...")
-            processed_payload = ex.run_task(task)
+            processed_payload = await ex.run_task(task)
             response = TaskResponse(id=task_request.id, payload={
                                     "response": processed_payload})
             return response
@@ -93,8 +251,8 @@ class TaskManager:
 if __name__ == "__main__":
     tm = TaskManager()
     payload = {"param1": "text"}
-    res = tm.process_task(
+    res = asyncio.run(tm.process_task(
         TaskRequest(id="test", auth="test",
                     task_name="test-task", payload=payload)
-    )
+    ))
     print(res)
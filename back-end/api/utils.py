@@ -21,7 +21,7 @@ async def exp_backoff(coro: Coroutine, attempts: int = 5,
     """ Retries a coroutine with exponential backoff. """
 
     for attempt in range(attempts):
-        logging.info(f"Attempt {attempt}.")
+        logging.debug("Attempt %d.", attempt)
         await exp_sleep(attempt, base=base)
         try:
             result = await asyncio.wait_for(asyncio.shield(coro), timeout=timeout)
@@ -0,0 +1,125 @@
+import logging
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, Mapping, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+try:
+    import msgpack
+except ImportError:  # Optional, JSON is always available
+    msgpack = None
+
+__doc__ = """ Wire formats for messages crossing process boundaries.
+            The format is recorded in the message attributes, so consumers decode whatever producers chose. """
+
+CONTENT_TYPE = "content-type"
+CONTENT_ENCODING = "content-encoding"
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class Codec(ABC):
+    content_type: str
+
+    @abstractmethod
+    def encode(self, model: BaseModel) -> bytes:
+        raise NotImplementedError
+
+    @abstractmethod
+    def decode(self, data: bytes, model_class: Type[M]) -> M:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    content_type = "application/json"
+
+    def encode(self, model: BaseModel) -> bytes:
+        return to_json(model)
+
+    def decode(self, data: bytes, model_class: Type[M]) -> M:
+        return model_class.model_validate_json(data)
+
+
+class MsgpackCodec(Codec):
+    content_type = "application/msgpack"
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise ImportError("Install 'msgpack' to use the msgpack codec.")
+
+    def encode(self, model: BaseModel) -> bytes:
+        return msgpack.packb(model.model_dump(), use_bin_type=True)
+
+    def decode(self, data: bytes, model_class: Type[M]) -> M:
+        return model_class.model_validate(msgpack.unpackb(data, raw=False))
+
+
+class WireCodec:
+    """ Encodes models with the configured codec and decodes them according to the message attributes.
+        Payloads larger than 'compress_threshold' bytes are zlib compressed.
+    """
+
+    def __init__(self, codec: str = "json", compress_threshold: int = 16 * 1024,
+                 compress_level: int = 6) -> None:
+        self._codecs: Dict[str, Codec] = {
+            JsonCodec.content_type: JsonCodec()}
+        if msgpack is not None:
+            self._codecs[MsgpackCodec.content_type] = MsgpackCodec()
+
+        names = {"json": JsonCodec, "msgpack": MsgpackCodec}
+        if codec not in names:
+            raise ValueError(f"Unknown codec '{codec}'.")
+        if names[codec].content_type not in self._codecs:
+            logging.warning(
+                "Codec '%s' is unavailable, falling back to JSON.", codec)
+            codec = "json"
+        self._default = self._codecs[names[codec].content_type]
+
+        self._compress_threshold = compress_threshold
+        self._compress_level = compress_level
+
+    def encode(self, model: BaseModel,
+               content_type: Optional[str] = None) -> Tuple[bytes, Dict[str, str]]:
+        """ Encodes a model for publishing.
+
+        Args:
+            model: The model to encode.
+            content_type: Codec to use instead of the default, e.g. to answer in the format a request came in.
+
+        Returns:
+            The encoded bytes and the message attributes describing them.
+        """
+        codec = self._codecs.get(content_type, self._default)
+        data = codec.encode(model)
+        attributes = {CONTENT_TYPE: codec.content_type}
+
+        if len(data) > self._compress_threshold:
+            data = zlib.compress(data, self._compress_level)
+            attributes[CONTENT_ENCODING] = "zlib"
+        return data, attributes
+
+    def decode(self, data: bytes, attributes: Optional[Mapping[str, str]],
+               model_class: Type[M]) -> M:
+        """ Decodes a received message. Messages without attributes are JSON.
+
+        Raises:
+            ValueError: If the content type or encoding is unknown.
+            ValidationError: If the decoded data doesn't match 'model_class'.
+        """
+        attributes = attributes or {}
+        encoding = attributes.get(CONTENT_ENCODING)
+        if encoding == "zlib":
+            try:
+                data = zlib.decompress(data)
+            except zlib.error as e:
+                raise ValueError(f"Invalid zlib payload: {e}")
+        elif encoding:
+            raise ValueError(f"Unknown content encoding '{encoding}'.")
+
+        content_type = attributes.get(CONTENT_TYPE, JsonCodec.content_type)
+        codec = self._codecs.get(content_type)
+        if codec is None:
+            raise ValueError(f"Unsupported content type '{content_type}'.")
+        return codec.decode(data, model_class)
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+from dotenv import load_dotenv
+
+from api.logs import configure_logging
+from api.task_recv import Container
+
+__doc__ = """ Standalone worker entry point. Pulls TaskRequests from the task subscriptions,
+            executes them and publishes the TaskResponses back to the API that requested them.
+
+            Usage: python -m api.worker --processes 4 """
+
+load_dotenv()
+
+
+async def run_worker() -> None:
+    container = Container()
+    loop = asyncio.get_running_loop()
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    orchestrator = container.orchestrator(loop=loop)
+    topic_manager = container.topic_manager()
+
+    def reload_topics() -> None:
+        try:
+            topic_manager.reload()
+        except (OSError, ValueError) as e:
+            logging.error("Unable to reload topics, keeping the current ones: %s", e)
+            return
+        orchestrator.subscribe(topic_manager)
+
+    # 'kill -HUP' applies an edited TOPICS_CONFIG without dropping in-flight tasks.
+    loop.add_signal_handler(signal.SIGHUP, reload_topics)
+
+    await orchestrator.serve(
+        topic_manager,
+        stop,
+        shutdown_timeout=container.shutdown_timeout()
+    )
+    logging.info("Worker stopped.")
+
+
+def main() -> None:
+    # SIGHUP terminates by default, so a reload sent while starting up is ignored until
+    # 'run_worker' installs its handler. The config is read at startup anyway.
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    configure_logging(logging.DEBUG if os.getenv('DEBUG') else logging.INFO)
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int,
+                        default=int(os.getenv('WORKER_PROCESSES', 1)),
+                        help="Number of independent worker processes to run.")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        main()
+    else:
+        # Children inherit the ignored SIGHUP until they install their own handler.
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        # Each process has its own event loop, Pub/Sub clients and executors.
+        processes = [multiprocessing.Process(target=main, name=f"worker-{i}")
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+
+        def stop_processes(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()  # Sends SIGTERM, so every worker drains
+
+        def reload_processes(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGHUP)
+
+        signal.signal(signal.SIGINT, stop_processes)
+        signal.signal(signal.SIGTERM, stop_processes)
+        signal.signal(signal.SIGHUP, reload_processes)
+        for process in processes:
+            process.join()
@@ -0,0 +1,150 @@
+import asyncio
+import concurrent.futures
+from collections import deque
+
+from api.idempotency import UpstashProcessedIdStore
+from api.rate_limiters import UpstashRateLimiter
+from api.tasks import TaskResponse
+
+__doc__ = """ In-memory stand-ins for Pub/Sub, Redis and the task manager, shared by the tests. """
+
+
+class FakeMessage:
+    """ A received Pub/Sub message that records how it was settled. """
+
+    def __init__(self, data=b"", attributes=None):
+        self.data = data
+        self.attributes = attributes or {}
+        self.acked = self.nacked = False
+        self.deadlines = []
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.nacked = True
+
+    def modify_ack_deadline(self, seconds):
+        self.deadlines.append(seconds)
+
+
+class FakeTaskManager:
+    def __init__(self, delay=0, fail=False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    def estimate(self, request):
+        return 0, 0
+
+    def batched(self, request):
+        return False
+
+    async def process_task(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("Executor failed.")
+        return TaskResponse(id=request.id, payload={"response": "ok"})
+
+
+class FakePublisherClient:
+    """ Confirms every publish right away, or never when 'confirm' is False. """
+
+    def __init__(self, confirm=True):
+        self.confirm = confirm
+        # Only the latest publishes, so long runs don't grow memory.
+        self.published = deque(maxlen=100)
+        self.stopped = False
+
+    def publish(self, topic, data, **attributes):
+        self.published.append((topic, data, attributes))
+        future = concurrent.futures.Future()
+        if self.confirm:
+            future.set_result(f"message-{len(self.published)}")
+        return future
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeSubscriberClient:
+    """ Streaming pulls that run until cancelled, and subscriptions that are only recorded. """
+
+    def __init__(self):
+        self.subscriptions = []
+        self.created = []
+        self.deleted = []
+
+    def subscribe(self, subscription, callback, flow_control=None):
+        self.subscriptions.append((subscription, flow_control))
+        return concurrent.futures.Future()
+
+    def create_subscription(self, request):
+        self.created.append(request)
+
+    def delete_subscription(self, request, timeout=None):
+        self.deleted.append(request["subscription"])
+
+    def close(self):
+        pass
+
+
+class FakeRedis:
+    """ Runs the Lua scripts of the Upstash rate limiter and processed ID store as their
+        Python equivalent over in-memory keys and sorted sets.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.zsets = {}
+        self.expiries = {}
+
+    async def eval(self, script, keys=None, args=None):
+        if script is UpstashRateLimiter._ACQUIRE_SCRIPT:
+            return self._acquire_slot(keys, args)
+        if script is UpstashRateLimiter._RELEASE_SCRIPT:
+            return int(self.zsets.get(keys[0], {}).pop(args[0], None) is not None)
+
+        key = keys[0]
+        value = self.values.get(key)
+        if script is UpstashProcessedIdStore._CLAIM_SCRIPT:
+            if value is not None:
+                return value
+            self.values[key], self.expiries[key] = args[0], int(args[1])
+            return None
+        if script is UpstashProcessedIdStore._EXTEND_SCRIPT:
+            if value != args[0]:
+                return 0
+            self.expiries[key] = int(args[1])
+            return 1
+        if script is UpstashProcessedIdStore._RELEASE_SCRIPT:
+            if value != args[0]:
+                return 0
+            del self.values[key]
+            return 1
+        raise AssertionError("Unexpected script.")
+
+    async def set(self, key, value, ex=None):
+        self.values[key], self.expiries[key] = value, ex
+
+    def _remove_until(self, key, score):
+        self.zsets[key] = {m: s for m, s in self.zsets.get(key, {}).items() if s > score}
+        return self.zsets[key]
+
+    def _acquire_slot(self, keys, args):
+        window_key, active_key = keys
+        now, period = float(args[0]), float(args[1])
+        limit, max_concurrent, member, task_ttl = int(args[2]), int(args[3]), args[4], float(args[5])
+
+        window = self._remove_until(window_key, now - period)
+        if len(window) >= limit:
+            return [1, str(min(window.values()))]
+        active = self._remove_until(active_key, now)
+        if len(active) >= max_concurrent:
+            return [2]
+        window[member] = now
+        self.expiries[window_key] = period
+        active[member] = now + task_ttl
+        self.expiries[active_key] = task_ttl
+        return [0]
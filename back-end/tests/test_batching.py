@@ -0,0 +1,103 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from api.batching import BatchTask, MicroBatcher
+from api.schedulers import TaskScheduler
+from api.task_executors import TaskExecutor
+from api.task_queue import GooglePubSubRequestCallback
+from api.tasks import (DummyTask, ResumeOptimizationTask, TaskManager,
+                       TaskRequest)
+
+
+class FakeExecutor(TaskExecutor):
+    def __init__(self, batch_answer=None):
+        self.calls = []
+        self.batch_answer = batch_answer
+
+    def is_available(self):
+        return True
+
+    async def run_task(self, task):
+        self.calls.append(task)
+        if isinstance(task, BatchTask):
+            if self.batch_answer is not None:
+                return self.batch_answer
+            return "```json\n" + json.dumps(
+                [t.payload["param1"] for t in task.tasks]) + "\n```"
+        return f"single {task.payload.get('param1')}"
+
+
+class MicroBatcherTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_small_tasks_share_one_call(self):
+        executor = FakeExecutor()
+        batcher = MicroBatcher(executor, max_batch=8, max_delay=0.01)
+
+        results = await asyncio.gather(*(
+            batcher.run_task(DummyTask(payload={"param1": str(i)})) for i in range(3)
+        ))
+
+        self.assertEqual(results, ["0", "1", "2"])
+        self.assertEqual(len(executor.calls), 1)
+
+    async def test_full_batch_is_sent_without_waiting(self):
+        executor = FakeExecutor()
+        batcher = MicroBatcher(executor, max_batch=2, max_delay=60)
+
+        results = await asyncio.wait_for(asyncio.gather(*(
+            batcher.run_task(DummyTask(payload={"param1": str(i)})) for i in range(2)
+        )), timeout=1)
+
+        self.assertEqual(results, ["0", "1"])
+
+    async def test_unparsable_batch_falls_back_to_single_calls(self):
+        executor = FakeExecutor(batch_answer="Sure! Here are your answers.")
+        batcher = MicroBatcher(executor, max_delay=0.01)
+
+        results = await asyncio.gather(*(
+            batcher.run_task(DummyTask(payload={"param1": str(i)})) for i in range(2)
+        ))
+
+        self.assertEqual(results, ["single 0", "single 1"])
+        self.assertEqual(len(executor.calls), 3)
+
+    async def test_other_tasks_are_not_batched(self):
+        executor = FakeExecutor()
+        batcher = MicroBatcher(executor)
+
+        await batcher.run_task(ResumeOptimizationTask(payload={"text": "resume"}))
+        self.assertIsInstance(executor.calls[0], ResumeOptimizationTask)
+
+
+class ScheduledBatchTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_batch_takes_one_slot_once_collected(self):
+        scheduler = TaskScheduler(concurrency=2)
+        with mock.patch("api.tasks.Gemini", FakeExecutor):
+            task_manager = TaskManager(micro_batching=True, scheduler=scheduler)
+        executor = task_manager._executors[0]._executor
+        callback = GooglePubSubRequestCallback(
+            loop=asyncio.get_running_loop(), task_manager=task_manager, scheduler=scheduler)
+
+        # Two long resumes hold every slot, yet more tasks than slots collect into one batch.
+        await scheduler.acquire()
+        await scheduler.acquire()
+        requests = [asyncio.ensure_future(callback._run_task(TaskRequest(
+            id=str(i), auth="auth", task_name="test-task", payload={"param1": str(i)})))
+            for i in range(8)]
+        await asyncio.sleep(0.05)
+        self.assertEqual(scheduler.pending, 1)
+        self.assertEqual(executor.calls, [])
+
+        scheduler.release()
+        responses = await asyncio.wait_for(asyncio.gather(*requests), timeout=1)
+
+        self.assertEqual([r.payload["response"] for r in responses], [str(i) for i in range(8)])
+        [batch] = executor.calls
+        self.assertEqual(len(batch.tasks), 8)
+        self.assertEqual(scheduler.running, 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
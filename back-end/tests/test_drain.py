@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import unittest
+
+from api.exceptions import UnableToPublishTask
+from api.schedulers import TaskScheduler
+from api.storages import DictStorage
+from api.task_queue import (GooglePubSub, GooglePubSubRequestCallback,
+                            GooglePubSubResponseCallback,
+                            GooglePubSubTaskPublisher,
+                            GooglePubSubTopicManager)
+from api.tasks import TaskRequest, TaskResponse
+from api.wire_codecs import WireCodec
+from tests.fakes import FakeMessage, FakePublisherClient, FakeSubscriberClient
+
+
+class SlowTaskManager:
+    def estimate(self, request):
+        return 0, 0
+
+    def batched(self, request):
+        return False
+
+    async def process_task(self, request):
+        await asyncio.sleep(10)
+        return TaskResponse(id=request.id, payload={"response": "ok"})
+
+
+def encode(request):
+    return WireCodec().encode(request)[0]
+
+
+class DrainTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    async def test_messages_are_nacked_while_draining(self):
+        callback = GooglePubSubResponseCallback(loop=asyncio.get_running_loop())
+        self.assertTrue(await callback.drain(timeout=1))
+
+        message = FakeMessage(encode(TaskResponse(id="id", payload={})))
+        callback(message)
+
+        self.assertTrue(message.nacked)
+        self.assertFalse(message.acked)
+
+    async def test_drain_times_out_with_tasks_running(self):
+        callback = GooglePubSubRequestCallback(
+            loop=asyncio.get_running_loop(), task_manager=SlowTaskManager(),
+            scheduler=TaskScheduler())
+        storage = DictStorage()
+        request = TaskRequest(id="id", auth="auth", task_name="test-task", payload={})
+        await storage.create("id")
+        await callback.set_storage_to_id(storage, "id")
+
+        running = FakeMessage(encode(request))
+        callback(running)
+        await asyncio.sleep(0)
+
+        self.assertFalse(await callback.drain(timeout=0.05))
+        # The running message is left for Pub/Sub to redeliver.
+        self.assertFalse(running.acked or running.nacked)
+        self.assertEqual(callback.gauges()["callback.futures.size"], 1)
+
+        late = FakeMessage(encode(request))
+        callback(late)
+        self.assertTrue(late.nacked)
+
+    async def test_publisher_rejects_tasks_after_shutdown(self):
+        pub_client = FakePublisherClient(confirm=False)
+        queue = GooglePubSub(project="project", pub_client=pub_client,
+                             consumer_client=FakeSubscriberClient())
+        publisher = GooglePubSubTaskPublisher(
+            queue=queue, topic_manager=GooglePubSubTopicManager(),
+            callback=GooglePubSubResponseCallback(loop=asyncio.get_running_loop()),
+            reply_to=None, codec=WireCodec())
+        storage = DictStorage()
+        request = TaskRequest(id="id", auth="auth", task_name="test-task", payload={})
+        await storage.create("id")
+
+        await publisher.publish_task(request, storage)
+        await publisher.shutdown(timeout=0.05)
+
+        self.assertTrue(pub_client.stopped)
+        # The unconfirmed publish is still tracked after the deadline.
+        self.assertEqual(queue.gauges()["pubsub.publish_futures.size"], 1)
+        with self.assertRaises(UnableToPublishTask):
+            await publisher.publish_task(request.model_copy(update={"id": "late"}), storage)
+
+
+if __name__ == '__main__':
+    unittest.main()
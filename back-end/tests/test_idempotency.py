@@ -0,0 +1,139 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from api.idempotency import InMemoryProcessedIdStore, UpstashProcessedIdStore
+from api.schedulers import TaskScheduler
+from api.storages import DictStorage
+from api.task_queue import GooglePubSubRequestCallback
+from api.tasks import TaskRequest, TaskResponse
+from tests.fakes import FakeMessage, FakeRedis, FakeTaskManager
+
+
+class InMemoryProcessedIdStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_claim_lifecycle(self):
+        store = InMemoryProcessedIdStore()
+        self.assertTrue((await store.claim("id")).acquired)
+
+        running = await store.claim("id")
+        self.assertFalse(running.acquired)
+        self.assertIsNone(running.result)
+
+        result = TaskResponse(id="id", payload={"response": "ok"})
+        await store.complete("id", result)
+        self.assertEqual((await store.claim("id")).result, result)
+
+    async def test_released_or_expired_claims_can_be_retried(self):
+        store = InMemoryProcessedIdStore(lease=60)
+        await store.claim("released")
+        await store.release("released")
+        self.assertTrue((await store.claim("released")).acquired)
+
+        store = InMemoryProcessedIdStore(lease=60)
+        with mock.patch("api.registries.time") as fake_time:
+            fake_time.monotonic.return_value = 0
+            await store.claim("crashed")
+            fake_time.monotonic.return_value = 61
+            self.assertTrue((await store.claim("crashed")).acquired)
+
+
+class UpstashProcessedIdStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.store = UpstashProcessedIdStore(ttl=3600, lease=120, redis=self.redis)
+
+    async def test_claim_lifecycle(self):
+        self.assertTrue((await self.store.claim("id")).acquired)
+        self.assertEqual(self.redis.expiries["processed-id:id"], 120)
+        self.assertFalse((await self.store.claim("id")).acquired)
+
+        result = TaskResponse(id="id", payload={"response": "ok"})
+        await self.store.complete("id", result)
+        self.assertEqual(self.redis.expiries["processed-id:id"], 3600)
+        self.assertEqual((await self.store.claim("id")).result, result)
+
+    async def test_extend_and_release_only_touch_running_claims(self):
+        await self.store.claim("id")
+        self.redis.expiries["processed-id:id"] = 5
+        await self.store.extend("id")
+        self.assertEqual(self.redis.expiries["processed-id:id"], 120)
+
+        await self.store.release("id")
+        self.assertTrue((await self.store.claim("id")).acquired)
+
+        result = TaskResponse(id="id", payload={"response": "ok"})
+        await self.store.complete("id", result)
+        await self.store.release("id")
+        self.assertEqual((await self.store.claim("id")).result, result)
+
+
+class IdempotentCallbackTestCase(unittest.IsolatedAsyncioTestCase):
+    def make_callback(self, task_manager, heartbeat_interval=None):
+        return GooglePubSubRequestCallback(
+            loop=asyncio.get_running_loop(), task_manager=task_manager,
+            scheduler=TaskScheduler(), heartbeat_interval=heartbeat_interval)
+
+    async def deliver(self, callback, storage, request):
+        message = FakeMessage()
+        await storage.create(request.id)
+        await callback.set_storage_to_id(storage, request.id)
+        await callback._execute_task(request.id, request, message)
+        return message
+
+    async def test_redelivery_reuses_response(self):
+        task_manager = FakeTaskManager()
+        callback = self.make_callback(task_manager)
+        storage = DictStorage()
+        request = TaskRequest(id="id", auth="auth", task_name="test-task", payload={})
+
+        for _ in range(2):
+            message = await self.deliver(callback, storage, request)
+            self.assertTrue(message.acked)
+            self.assertEqual((await storage.read("id")).payload, {"response": "ok"})
+            await storage.delete("id")
+
+        self.assertEqual(task_manager.calls, 1)
+
+    async def test_concurrent_duplicate_is_nacked(self):
+        task_manager = FakeTaskManager(delay=0.05)
+        callback = self.make_callback(task_manager, heartbeat_interval=0.02)
+        request = TaskRequest(id="id", auth="auth", task_name="test-task", payload={})
+        storage = DictStorage(maxsize=2)
+
+        first, duplicate = FakeMessage(), FakeMessage()
+        await storage.create("id")
+        await callback.set_storage_to_id(storage, "id")
+        await asyncio.gather(callback._execute_task("id", request, first),
+                             callback._execute_task("id", request, duplicate))
+
+        self.assertEqual(task_manager.calls, 1)
+        self.assertTrue(first.acked)
+        self.assertTrue(duplicate.nacked)
+        # The slow task kept its message alive.
+        self.assertEqual(first.deadlines[0], 60)
+
+    async def test_ack_deadline_must_fit_pubsub(self):
+        for ack_deadline in (5, 601):
+            with self.assertRaises(ValueError):
+                GooglePubSubRequestCallback(
+                    loop=asyncio.get_running_loop(), task_manager=FakeTaskManager(),
+                    scheduler=TaskScheduler(), ack_deadline=ack_deadline)
+
+    async def test_failed_task_can_be_retried(self):
+        task_manager = FakeTaskManager(fail=True)
+        callback = self.make_callback(task_manager)
+        storage = DictStorage()
+        request = TaskRequest(id="id", auth="auth", task_name="test-task", payload={})
+
+        with self.assertRaises(RuntimeError):
+            await self.deliver(callback, storage, request)
+        await storage.delete("id")
+
+        task_manager.fail = False
+        message = await self.deliver(callback, storage, request)
+        self.assertTrue(message.acked)
+        self.assertEqual(task_manager.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
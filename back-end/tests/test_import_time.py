@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# Modules that build network clients or pull in NumPy and must only be imported on first use.
+LAZY_MODULES = ('google.cloud.pubsub_v1', 'google.generativeai', 'grpc',
+                'api.job_matching', 'numpy')
+BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', 2000))
+REPORT_PATH = os.getenv('IMPORT_TIME_REPORT')
+
+
+def profile_import(module: str) -> tuple[list[tuple[int, int, str]], list[str]]:
+    """ Imports 'module' in a fresh interpreter with '-X importtime'.
+
+    Returns:
+        The (self_us, cumulative_us, name) entries sorted by cumulative time and
+        the lazy modules that were imported anyway.
+    """
+    script = (f"import sys, {module}\n"
+              f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((int(self_us), int(cumulative_us), name.strip()))
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+
+    loaded = [m for m in proc.stdout.strip().split(',') if m]
+    return entries, loaded
+
+
+def format_report(entries: list[tuple[int, int, str]], top: int = 25) -> str:
+    lines = [f"{'cumulative [ms]':>16} | {'self [ms]':>10} | module"]
+    for self_us, cumulative_us, name in entries[:top]:
+        lines.append(
+            f"{cumulative_us / 1000:16.1f} | {self_us / 1000:10.1f} | {name}")
+    return '\n'.join(lines)
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    def test_api_main_import_time(self):
+        entries, loaded = profile_import('api.main')
+        report = format_report(entries)
+        if REPORT_PATH:
+            with open(REPORT_PATH, 'w') as f:
+                f.write(report + '\n')
+
+        self.assertEqual(
+            loaded, [], f"Expensive clients imported eagerly:\n{report}")
+
+        total_ms = next(c for _, c, name in entries if name == 'api.main') / 1000
+        self.assertLess(
+            total_ms, BUDGET_MS,
+            f"Importing api.main took {total_ms:.1f}ms (budget {BUDGET_MS}ms):\n{report}")
+
+
+if __name__ == '__main__':
+    unittest.main()
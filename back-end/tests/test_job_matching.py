@@ -0,0 +1,64 @@
+import unittest
+
+from api.job_matching import JobDescription, JobIndex
+
+RESUME = """Software Engineer
+Built REST APIs in Python with FastAPI and Docker.
+Some React on the side."""
+
+
+class JobIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = JobIndex()
+        self.index.add([
+            JobDescription(id="backend", title="Python Backend Engineer",
+                           text="Python, FastAPI, PostgreSQL, Docker and Kubernetes."),
+            JobDescription(id="frontend", title="Frontend Developer",
+                           text="React, TypeScript and Tailwind CSS."),
+            JobDescription(id="data", title="Data Scientist",
+                           text="pandas, scikit-learn and statistics."),
+        ])
+
+    def test_ranks_by_similarity(self):
+        matches = self.index.match(RESUME, top_k=2)
+        self.assertEqual([m.job_id for m in matches], ["backend", "frontend"])
+        self.assertGreater(matches[0].score, matches[1].score)
+
+    def test_missing_keywords_skip_resume_terms(self):
+        missing = self.index.match(RESUME, top_k=1)[0].missing_keywords
+        self.assertIn("kubernetes", missing)
+        self.assertNotIn("python", missing)
+        self.assertNotIn("docker", missing)
+
+    def test_hint(self):
+        self.assertIn("postgresql", self.index.hint(RESUME, "backend"))
+        with self.assertRaises(KeyError):
+            self.index.hint(RESUME, "unknown")
+
+    def test_replace_and_remove(self):
+        self.index.add([JobDescription(id="data", text="Python FastAPI Docker REST")])
+        self.assertEqual(self.index.match(RESUME, top_k=1)[0].job_id, "data")
+
+        self.index.remove("data")
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(JobIndex().match(RESUME), [])
+
+    def test_width_is_fixed(self):
+        index = JobIndex(features=64)
+        index.add(JobDescription(id=str(i), text=f"term{i} other{i}") for i in range(100))
+
+        self.assertTrue(all(columns.max() < 64 for columns, _ in index._rows))
+        self.assertEqual(len(index), 100)
+        self.assertEqual(index.match("term42 other42", top_k=1)[0].job_id, "42")
+
+    def test_rows_only_store_their_terms(self):
+        index = JobIndex(features=2 ** 20)
+        index.add([JobDescription(id="a", text="python python docker"),
+                   JobDescription(id="b", text="react")])
+
+        self.assertEqual([len(columns) for columns, _ in index._rows], [2, 1])
+        self.assertEqual(index.match("react", top_k=1)[0].job_id, "b")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+import unittest
+from unittest import mock
+
+from api.logs import (DeferredQueueHandler, SamplingFilter, TruncatingFilter,
+                      configure_logging)
+
+
+def make_record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+class Expensive:
+    formatted = 0
+
+    def __str__(self):
+        Expensive.formatted += 1
+        return "expensive"
+
+
+class LogFiltersTestCase(unittest.TestCase):
+    def test_sampling_per_template(self):
+        sampler = SamplingFilter(every=3)
+        kept = [sampler.filter(make_record("Processing %s.", i)) for i in range(6)]
+        self.assertEqual(kept, [True, False, False, True, False, False])
+
+        self.assertTrue(sampler.filter(make_record("Another message.")))
+        self.assertTrue(all(sampler.filter(make_record("Failed.", level=logging.ERROR))
+                            for _ in range(3)))
+
+    def test_truncation(self):
+        record = make_record("Payload: %s", "x" * 1000)
+        TruncatingFilter(max_length=20).filter(record)
+
+        message = record.getMessage()
+        self.assertTrue(message.startswith("Payload: xxxxxxxxxxx...["))
+        self.assertLess(len(message), 50)
+
+    def test_queue_handler_defers_formatting(self):
+        handler = DeferredQueueHandler(mock.Mock())
+        handler.handle(make_record("Result: %s", Expensive()))
+        self.assertEqual(Expensive.formatted, 0)
+
+
+class ConfigureLoggingTestCase(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.addCleanup(setattr, root, 'handlers', root.handlers[:])
+        self.addCleanup(root.setLevel, root.level)
+
+    def test_production_mode_writes_json_lines(self):
+        stream = io.StringIO()
+        with mock.patch('sys.stderr', stream), \
+                mock.patch.dict('os.environ', {'LOG_MAX_LENGTH': '10'}):
+            listener = configure_logging(logging.INFO, mode='production')
+        logging.info("Task %s result: %s.", "id", "y" * 100)
+        listener.stop()
+
+        entry = json.loads(stream.getvalue().splitlines()[-1])
+        self.assertEqual(entry["level"], "INFO")
+        self.assertTrue(entry["message"].startswith("Task id re..."))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,16 @@
 import os
 import unittest
 import uuid
+from io import BytesIO
+from unittest import mock
 
 from dotenv import load_dotenv
 from fastapi.testclient import TestClient
+from reportlab.pdfgen import canvas
 
+from api import main
+from api.exceptions import ServiceOverloaded
+from api.jobs import JobDescription
 from api.main import app
 
 load_dotenv()
@@ -23,5 +29,56 @@ class MyTestCase(unittest.TestCase):
         self.assertIsInstance(uuid.UUID(token, version=4), uuid.UUID)
 
 
+def make_resume() -> bytes:
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for y, line in zip(range(800, 0, -20), ["Resume", "Experience: Python, FastAPI",
+                                             "Education: BSc", "Skills: Docker"]):
+        pdf.drawString(72, y, line)
+    pdf.save()
+    return buffer.getvalue()
+
+
+class ResumeJobHintTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.token = self.client.get("/auth").json()["auth"]
+        job_index = main.get_job_index()
+        job_index.add([JobDescription(id="backend", text="Python Kubernetes PostgreSQL")])
+        self.addCleanup(job_index.remove, "backend")
+
+        patcher = mock.patch("api.main.request_task", new_callable=mock.AsyncMock,
+                             return_value={"id": "id", "payload": {"response": "ok"}})
+        self.request_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, job_id):
+        return self.client.post("/resume", params={"token": self.token, "job_id": job_id},
+                                files={"resume": ("resume.pdf", make_resume(), "application/pdf")})
+
+    def test_known_job_hint_reaches_the_request(self):
+        response = self.post("backend")
+
+        self.assertEqual(response.status_code, 200)
+        request = self.request_task.call_args.args[0]
+        self.assertEqual(request["task_name"], "resume-optimization")
+        self.assertIn("kubernetes", request["payload"]["job_hint"])
+        self.assertNotIn("python", request["payload"]["job_hint"])
+
+    def test_unknown_job_is_not_found(self):
+        response = self.post("unknown")
+
+        self.assertEqual(response.status_code, 404)
+        self.request_task.assert_not_called()
+
+    def test_overload_is_unavailable_with_retry_after(self):
+        self.request_task.side_effect = ServiceOverloaded("Too many tasks.", retry_after=2)
+
+        response = self.post("backend")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "2")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.profiling import ProfilingMiddleware
+
+
+async def wait_on_lock(lock: asyncio.Lock):
+    async with lock:
+        pass
+
+
+def make_app(directory, **kwargs):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, directory=directory, interval=0.001, **kwargs)
+
+    @app.get('/slow')
+    async def slow():
+        time.sleep(0.05)  # Blocks the loop, like parsing a PDF
+        lock = asyncio.Lock()
+        await lock.acquire()
+        asyncio.get_running_loop().call_later(0.05, lock.release)
+        await wait_on_lock(lock)
+        return {}
+
+    return app
+
+
+class ProfilingMiddlewareTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def profiles(self):
+        return os.listdir(self.directory.name)
+
+    def test_profiles_requests_with_header(self):
+        client = TestClient(make_app(self.directory.name, token='secret'))
+        client.get('/slow')
+        self.assertEqual(self.profiles(), [])
+
+        client.get('/slow', headers={'X-Profile': 'secret'})
+        [profile] = self.profiles()
+        self.assertTrue(profile.endswith('GET_slow.folded'))
+
+        with open(os.path.join(self.directory.name, profile)) as f:
+            folded = f.read()
+        # Both the blocking call and the lock wait are attributed to the handler.
+        self.assertRegex(folded, r'slow \(test_profiling\.py:\d+\) \d+')
+        self.assertRegex(folded, r'wait_on_lock .*;Lock\.acquire .*\d+')
+
+    def test_token_and_sample_rate(self):
+        client = TestClient(make_app(self.directory.name, token='secret', sample_rate=0))
+        client.get('/slow', headers={'X-Profile': 'wrong'})
+        self.assertEqual(self.profiles(), [])
+
+        # Without a token the header is ignored.
+        client = TestClient(make_app(self.directory.name))
+        client.get('/slow', headers={'X-Profile': '1'})
+        self.assertEqual(self.profiles(), [])
+
+        client = TestClient(make_app(self.directory.name, sample_rate=1))
+        client.get('/slow')
+        self.assertEqual(len(self.profiles()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
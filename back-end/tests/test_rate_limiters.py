@@ -0,0 +1,147 @@
+import unittest
+from unittest import mock
+
+from api.exceptions import (ConcurrencyLimitExceeded, RateLimitExceeded,
+                            UnableToFetchResultError)
+from api.rate_limiters import InMemoryRateLimiter, UpstashRateLimiter
+from api.storages import DictStorage
+from api.task_api import request_task
+from tests.fakes import FakeRedis
+
+
+class FakePublisher:
+    def __init__(self):
+        self.published = []
+
+    async def publish_task(self, message, storage):
+        self.published.append(message)  # The response never comes back
+
+
+class InMemoryRateLimiterTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_window_limit(self):
+        limiter = InMemoryRateLimiter(limit=2, period=60, max_concurrent=10)
+        await limiter.acquire("token")
+        await limiter.acquire("token")
+
+        with self.assertRaises(RateLimitExceeded) as ctx:
+            await limiter.acquire("token")
+        self.assertGreater(ctx.exception.retry_after, 0)
+
+        await limiter.acquire("other-token")
+
+    async def test_window_slides(self):
+        limiter = InMemoryRateLimiter(limit=1, period=60, max_concurrent=10)
+        with mock.patch("api.rate_limiters.time") as fake_time:
+            fake_time.monotonic.return_value = 0
+            await limiter.acquire("token")
+            fake_time.monotonic.return_value = 61
+            await limiter.acquire("token")
+
+    async def test_concurrency_limit(self):
+        limiter = InMemoryRateLimiter(limit=10, period=60, max_concurrent=1)
+        slot = await limiter.acquire("token")
+
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            await limiter.acquire("token")
+
+        await limiter.release("token", slot)
+        await limiter.acquire("token")
+
+    async def test_lost_slot_expires(self):
+        limiter = InMemoryRateLimiter(limit=10, period=60, max_concurrent=1, task_ttl=300)
+        with mock.patch("api.rate_limiters.time") as fake_time:
+            fake_time.monotonic.return_value = 0
+            lost = await limiter.acquire("token")  # Never released
+
+            fake_time.monotonic.return_value = 100
+            with self.assertRaises(ConcurrencyLimitExceeded):
+                await limiter.acquire("token")
+
+            fake_time.monotonic.return_value = 301
+            await limiter.acquire("token")
+            # The late release of the expired slot doesn't free the live one.
+            await limiter.release("token", lost)
+            with self.assertRaises(ConcurrencyLimitExceeded):
+                await limiter.acquire("token")
+
+    def test_invalid_task_ttl(self):
+        with self.assertRaises(ValueError):
+            InMemoryRateLimiter(task_ttl=0)
+
+
+class UpstashRateLimiterTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+
+    async def test_window_limit(self):
+        limiter = UpstashRateLimiter(limit=2, period=60, max_concurrent=10, redis=self.redis)
+        with mock.patch("api.rate_limiters.time") as fake_time:
+            fake_time.time.return_value = 1000
+            await limiter.acquire("token")
+            fake_time.time.return_value = 1010.5
+            await limiter.acquire("token")
+            fake_time.time.return_value = 1020
+            with self.assertRaises(RateLimitExceeded) as ctx:
+                await limiter.acquire("token")
+            # The oldest request leaves the window at 1060.
+            self.assertEqual(ctx.exception.retry_after, 40)
+            await limiter.acquire("other-token")
+
+            fake_time.time.return_value = 1061
+            await limiter.acquire("token")
+
+        self.assertEqual(self.redis.expiries["rate-limit:token:window"], 60)
+
+    async def test_concurrency_limit(self):
+        limiter = UpstashRateLimiter(limit=10, period=60, max_concurrent=1,
+                                     task_ttl=300, redis=self.redis)
+        slot = await limiter.acquire("token")
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            await limiter.acquire("token")
+
+        await limiter.release("token", slot)
+        await limiter.release("token", slot)  # Releasing twice frees nothing else
+        self.assertEqual(self.redis.zsets["rate-limit:token:active"], {})
+        await limiter.acquire("token")
+
+    async def test_lost_slot_expires_while_token_is_busy(self):
+        limiter = UpstashRateLimiter(limit=10, period=60, max_concurrent=2,
+                                     task_ttl=300, redis=self.redis)
+        with mock.patch("api.rate_limiters.time") as fake_time:
+            fake_time.time.return_value = 0
+            await limiter.acquire("token")  # Lost by a crashed worker
+
+            # The token keeps acquiring, the lost slot still expires on time.
+            for now in (100, 200, 290):
+                fake_time.time.return_value = now
+                slot = await limiter.acquire("token")
+                await limiter.release("token", slot)
+
+            fake_time.time.return_value = 299
+            await limiter.acquire("token")
+            with self.assertRaises(ConcurrencyLimitExceeded):
+                await limiter.acquire("token")
+
+            fake_time.time.return_value = 301
+            await limiter.acquire("token")
+
+    def test_invalid_task_ttl(self):
+        with self.assertRaises(ValueError):
+            UpstashRateLimiter(task_ttl=0, redis=self.redis)
+
+
+class RequestTaskTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_lost_task_times_out_and_frees_its_slot(self):
+        limiter = InMemoryRateLimiter(limit=10, period=60, max_concurrent=1)
+        storage = DictStorage()
+        request = {"auth": "token", "task_name": "test-task", "payload": {"param1": "x"}}
+
+        with self.assertRaises(UnableToFetchResultError):
+            await request_task(dict(request), storage=storage, queue=FakePublisher(),
+                               rate_limiter=limiter, timeout=0.01)
+
+        await limiter.acquire("token")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from unittest import mock
+
+from api.exceptions import RegistryFullError
+from api.registries import BoundedRegistry
+
+
+class BoundedRegistryTestCase(unittest.TestCase):
+    def test_full_registry_rejects_new_keys(self):
+        registry = BoundedRegistry("test", maxsize=2)
+        registry.set("a", 1)
+        registry.set("b", 2)
+
+        self.assertTrue(registry.full())
+        with self.assertRaises(RegistryFullError):
+            registry.set("c", 3)
+        # Existing keys can still be updated and nothing was evicted.
+        registry.set("a", 4)
+        self.assertEqual(registry.values(), [2, 4])
+        self.assertEqual(registry.gauges()["test.rejections"], 1)
+
+        registry.discard("b", 2)
+        registry.set("c", 3)
+        self.assertEqual(registry.get("c"), 3)
+
+    def test_evict_oldest(self):
+        registry = BoundedRegistry("test", maxsize=2, evict_oldest=True)
+        for key in "abc":
+            registry.set(key, key)
+
+        self.assertFalse(registry.full())
+        self.assertNotIn("a", registry)
+        self.assertEqual(registry.gauges()["test.evictions"], 1)
+
+    def test_expired_entries_make_room(self):
+        with mock.patch("api.registries.time") as fake_time:
+            fake_time.monotonic.return_value = 0
+            registry = BoundedRegistry("test", maxsize=1, ttl=10)
+            registry.set("a", 1)
+
+            fake_time.monotonic.return_value = 11
+            registry.set("b", 2)
+            self.assertEqual(registry.values(), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+
+from api.exceptions import InvalidTemplate
+from api.rendering import DocumentRenderer
+from api.tasks import TaskResponse
+
+RESUME = """John Doe
+john@doe.com
+Experience
+- Cut costs by 30% <and> counting
+Education
+BSc in Computer Science"""
+
+
+class DocumentRendererTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.renderer = DocumentRenderer(max_workers=1)
+        self.response = TaskResponse(id="test", payload={"response": RESUME})
+
+    def tearDown(self):
+        self.renderer.shutdown()
+
+    async def test_render_formats(self):
+        pdf = await self.renderer.render(self.response, "classic")
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+        page = (await self.renderer.render(self.response, "classic", "html")).decode()
+        self.assertIn("<h1>John Doe</h1>", page)
+        self.assertIn("<h2>Experience</h2>", page)
+        self.assertIn("&lt;and&gt;", page)
+
+    async def test_documents_are_cached(self):
+        first = await self.renderer.render(self.response, "modern", "html")
+        second = await self.renderer.render(
+            TaskResponse(id="other", payload={"response": RESUME}), "modern", "html")
+        self.assertIs(first, second)
+
+    async def test_templates_share_the_parsed_resume(self):
+        classic, modern, again = await asyncio.gather(*(
+            self.renderer.render(self.response, template_id, "html")
+            for template_id in ["classic", "modern", "classic"]))
+
+        self.assertNotEqual(classic, modern)
+        self.assertEqual(classic, again)
+        self.assertEqual(len(self.renderer._contents), 1)
+
+    async def test_unknown_template_or_format(self):
+        with self.assertRaises(InvalidTemplate):
+            await self.renderer.render(self.response, "unknown")
+        with self.assertRaises(InvalidTemplate):
+            await self.renderer.render(self.response, "classic", "docx")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from api.schedulers import TaskScheduler
+
+
+class TaskSchedulerTestCase(unittest.IsolatedAsyncioTestCase):
+    async def run_in_order(self, scheduler, jobs):
+        order = []
+
+        async def job(name, priority, cost):
+            await scheduler.acquire(priority=priority, cost=cost)
+            order.append(name)
+            scheduler.release()
+
+        await scheduler.acquire()  # Keep the only slot busy while jobs queue up
+        tasks = [asyncio.create_task(job(*j)) for j in jobs]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    async def test_priority_then_shortest_job_first(self):
+        scheduler = TaskScheduler(concurrency=1, aging_rate=0)
+        order = await self.run_in_order(scheduler, [
+            ("large", 1, 5000), ("small", 1, 50), ("urgent", 0, 9000)
+        ])
+        self.assertEqual(order, ["urgent", "small", "large"])
+
+    async def test_aging_prevents_starvation(self):
+        scheduler = TaskScheduler(concurrency=1, aging_rate=500)
+        await scheduler.acquire()
+
+        order = []
+
+        async def job(name, cost):
+            await scheduler.acquire(cost=cost)
+            order.append(name)
+            scheduler.release()
+
+        # Only the scheduler's clock is faked, the event loop keeps the real one.
+        with mock.patch("api.schedulers.time") as fake_time:
+            fake_time.monotonic.return_value = 0
+            large = asyncio.create_task(job("large", 5000))
+            await asyncio.sleep(0)
+
+            fake_time.monotonic.return_value = 20
+            small = asyncio.create_task(job("small", 50))
+            await asyncio.sleep(0)
+            scheduler.release()
+            await asyncio.gather(large, small)
+
+        self.assertEqual(order, ["large", "small"])
+
+    async def test_cancelled_waiter_frees_its_place(self):
+        scheduler = TaskScheduler(concurrency=1)
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        self.assertEqual(scheduler.pending, 0)
+        scheduler.release()
+        self.assertEqual(scheduler.running, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
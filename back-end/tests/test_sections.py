@@ -0,0 +1,179 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from api.sections import SectionCache, split_sections
+from api.task_executors import TaskExecutor
+from api.tasks import (ResumeOptimizationTask, ResumeSectionOptimizationTask,
+                       TaskManager, TaskRequest)
+
+RESUME = """John Doe
+john@doe.com
+Experience
+- Built a thing
+- Led a team
+EDUCATION:
+BSc in Computer Science
+Skills: Python, SQL"""
+
+
+class SplitSectionsTestCase(unittest.TestCase):
+    def test_split_on_headings(self):
+        sections = split_sections(RESUME)
+        self.assertEqual([s.heading for s in sections],
+                         ['', 'Experience', 'EDUCATION'])
+        self.assertEqual(sections[0].text, 'John Doe\njohn@doe.com')
+        # 'Skills: ...' carries content, so it isn't a heading.
+        self.assertIn('Skills: Python, SQL', sections[2].text)
+
+    def test_markdown_headings(self):
+        sections = split_sections("**John Doe**\n## Experience\n- Built\n**Education:**\nBSc")
+        self.assertEqual([s.heading for s in sections], ['', 'Experience', 'Education'])
+
+    def test_digest_changes_with_content(self):
+        before = split_sections(RESUME)
+        after = split_sections(RESUME.replace('Led a team', 'Led a team of 5'))
+        self.assertEqual(before[0].digest, after[0].digest)
+        self.assertNotEqual(before[1].digest, after[1].digest)
+        self.assertEqual(before[2].digest, after[2].digest)
+
+
+class SectionCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used_lineage(self):
+        cache = SectionCache(maxsize=2)
+        cache.set('a', {'digest': 'text'})
+        cache.set('b', {})
+        cache.get('a')
+        cache.set('c', {})
+
+        self.assertEqual(cache.get('a'), {'digest': 'text'})
+        self.assertEqual(cache.get('b'), {})
+        self.assertEqual(len(cache), 2)
+
+
+class CountingExecutor(TaskExecutor):
+    def __init__(self):
+        self.calls = 0
+        self.tasks = []
+
+    def is_available(self):
+        return True
+
+    async def run_task(self, task):
+        self.calls += 1
+        self.tasks.append(task)
+        return task.payload["text"].upper()
+
+
+class MarkdownExecutor(CountingExecutor):
+    """ Answers full resumes in markdown, reorganized like Gemini does. """
+
+    async def run_task(self, task):
+        if isinstance(task, ResumeSectionOptimizationTask):
+            return await super().run_task(task)
+        self.calls += 1
+        self.tasks.append(task)
+        return ("**John Doe** | john@doe.com\n\n**Experience**\n- Built a product\n- Led a team\n\n"
+                "**Education**\nBSc in Computer Science\nSkills: Python, SQL")
+
+
+class FailingExecutor(TaskExecutor):
+    """ Fails the 'Experience' section and hangs on the others. """
+
+    def __init__(self):
+        self.slow = None
+
+    def is_available(self):
+        return True
+
+    async def run_task(self, task):
+        if task.payload["heading"] == "Experience":
+            await asyncio.sleep(0)
+            raise RuntimeError("Section failed.")
+        self.slow = asyncio.current_task()
+        await asyncio.Event().wait()
+
+
+class SectionReuseTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_only_changed_section_is_rerun(self):
+        with mock.patch("api.tasks.Gemini", CountingExecutor):
+            manager = TaskManager(micro_batching=False)
+        executor = manager._executors[0]
+
+        def request(text):
+            return TaskRequest(id="id", auth="auth", task_name="resume-optimization",
+                               payload={"text": text})
+
+        # The first submission is optimized in one call with the full prompt.
+        first = await manager.process_task(request(RESUME))
+        self.assertEqual(executor.calls, 1)
+        self.assertEqual(first.payload["changed_sections"], 3)
+        self.assertIsInstance(executor.tasks[0], ResumeOptimizationTask)
+        self.assertNotIsInstance(executor.tasks[0], ResumeSectionOptimizationTask)
+
+        second = await manager.process_task(
+            request(RESUME.replace('Led a team', 'Led a team of 5')))
+        self.assertEqual(executor.calls, 2)
+        self.assertEqual(second.payload["changed_sections"], 1)
+        self.assertIsInstance(executor.tasks[1], ResumeSectionOptimizationTask)
+        self.assertIn("LED A TEAM OF 5", second.payload["response"])
+
+    async def test_markdown_answer_seeds_the_matching_sections(self):
+        with mock.patch("api.tasks.Gemini", MarkdownExecutor):
+            manager = TaskManager(micro_batching=False)
+        executor = manager._executors[0]
+
+        for text in (RESUME, RESUME.replace('Led a team', 'Led a team of 5')):
+            response = await manager.process_task(TaskRequest(
+                id="id", auth="auth", task_name="resume-optimization", payload={"text": text}))
+
+        self.assertEqual(executor.calls, 2)
+        self.assertEqual([task.payload["heading"] for task in executor.tasks[1:]], ["Experience"])
+        self.assertEqual(response.payload["changed_sections"], 1)
+        text = response.payload["response"]
+        self.assertEqual(text.count("John Doe"), 1)
+        self.assertEqual(text.count("BSc in Computer Science"), 1)
+        self.assertIn("LED A TEAM OF 5", text)
+
+    async def test_mismatched_answer_is_not_reused(self):
+        with mock.patch("api.tasks.Gemini", MarkdownExecutor):
+            manager = TaskManager(micro_batching=False)
+        executor = manager._executors[0]
+        resume = RESUME.replace("Experience", "Projects")
+
+        for text in (resume, resume.replace('Led a team', 'Led a team of 5')):
+            await manager.process_task(TaskRequest(
+                id="id", auth="auth", task_name="resume-optimization", payload={"text": text}))
+
+        # The answer's headings differ, so not even the unchanged header is reused.
+        self.assertEqual(executor.calls, 2)
+        self.assertFalse(any(isinstance(task, ResumeSectionOptimizationTask)
+                             for task in executor.tasks))
+
+    async def test_resume_without_known_headings_runs_in_one_call(self):
+        with mock.patch("api.tasks.Gemini", CountingExecutor):
+            manager = TaskManager(micro_batching=False)
+        executor = manager._executors[0]
+
+        for text in ("Jane Roe\nDid things", "Jane Roe\nDid more things"):
+            await manager.process_task(TaskRequest(
+                id="id", auth="auth", task_name="resume-optimization", payload={"text": text}))
+        self.assertEqual(executor.calls, 2)
+        self.assertFalse(any(isinstance(task, ResumeSectionOptimizationTask)
+                             for task in executor.tasks))
+
+    async def test_failed_section_cancels_the_others(self):
+        with mock.patch("api.tasks.Gemini", FailingExecutor):
+            manager = TaskManager(micro_batching=False)
+        executor = manager._executors[0]
+        manager._section_cache.set("auth", {split_sections(RESUME)[2].digest: "EDUCATION"})
+
+        with self.assertRaises(RuntimeError):
+            await manager.process_task(TaskRequest(
+                id="id", auth="auth", task_name="resume-optimization", payload={"text": RESUME}))
+        await asyncio.sleep(0)
+        self.assertTrue(executor.slow.cancelled())
+
+
+if __name__ == '__main__':
+    unittest.main()
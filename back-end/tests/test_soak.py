@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import logging
+import os
+import tracemalloc
+import types
+import unittest
+from unittest import mock
+
+import pydantic.main
+
+from api.storages import DictStorage
+from api.task_queue import GooglePubSub, GooglePubSubResponseCallback
+from api.tasks import TaskRequest, TaskResponse
+from api.wire_codecs import WireCodec
+from tests.fakes import FakeMessage, FakePublisherClient
+
+# Opt-in, as it runs for minutes: CI runs a million requests in a separate step.
+SOAK_REQUESTS = int(os.getenv('SOAK_REQUESTS', 0))
+# Every Nth request never gets a response, so only expiry can remove it.
+ABANDON_EVERY = 100
+# Requests published before their responses are delivered. The previous batch's responses
+# are delivered again with them, so the deliveries overflow the callback's 100 running
+# tasks and some are nacked.
+BATCH = 64
+MAX_GROWTH_BYTES = 256 * 1024
+
+
+def traced_bytes():
+    """ Memory allocated since tracing started, except pydantic-core's bounded cache of decoded
+        strings: the entries it replaces were allocated before, so only their successors are traced.
+    """
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, pydantic.main.__file__)])
+    return sum(stat.size for stat in snapshot.statistics('filename'))
+
+
+@unittest.skipUnless(SOAK_REQUESTS, "Set SOAK_REQUESTS to run the soak test.")
+class SoakTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.nacks = 0
+        self.redeliveries = []
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    async def run_batch(self, start, stop, queue, callback, storage):
+        responses, answered = [], []
+        for i in range(start, stop):
+            request_id = f"request-{i}"
+            request = TaskRequest(id=request_id, auth="auth",
+                                  task_name="test-task", payload={"param1": "x"})
+
+            await storage.create(request_id)
+            await callback.set_storage_to_id(storage, request_id)
+            queue.publish(request.model_dump_json().encode(),
+                          "topic", request_id)
+
+            if i % ABANDON_EVERY:
+                responses.append(WireCodec().encode(
+                    TaskResponse(id=request_id, payload={"response": "ok"})))
+                answered.append(request_id)
+
+        # Pub/Sub delivers at least once; the second delivery finds no storage.
+        messages = [FakeMessage(data, attributes)
+                    for data, attributes in responses + self.redeliveries]
+        self.redeliveries = responses
+        while messages:
+            # Delivered without yielding to the loop, as if the subscriber's thread outpaced it.
+            for message in messages:
+                callback(message)
+            running = callback._futures.values()
+            if running:
+                await asyncio.wait([asyncio.wrap_future(future) for future in running])
+            # Nacked messages are redelivered.
+            messages = [FakeMessage(message.data, message.attributes)
+                        for message in messages if message.nacked]
+            self.nacks += len(messages)
+
+        for request_id in answered:
+            await storage.read(request_id)
+        for i in range(start, stop):
+            await storage.delete(f"request-{i}")
+
+    async def run_requests(self, start, stop, queue, callback, storage):
+        for batch in range(start, stop, BATCH):
+            await self.run_batch(batch, min(batch + BATCH, stop), queue, callback, storage)
+
+    async def test_memory_stays_flat(self):
+        # Debug mode records a traceback for every callback handed to the loop.
+        asyncio.get_running_loop().set_debug(False)
+        queue = GooglePubSub(project="project", pub_client=FakePublisherClient(),
+                             consumer_client=object(), maxsize=100)
+        callback = GooglePubSubResponseCallback(
+            loop=asyncio.get_running_loop(), maxsize=100, storage_ttl=10)
+        # Every registry access moves the clock, so abandoned storages expire long before
+        # enough of them pile up to fill the registry.
+        clock = itertools.count(step=0.001)
+        # A plain function, as a Mock would record every call.
+        patcher = mock.patch("api.registries.time",
+                             types.SimpleNamespace(monotonic=lambda: next(clock)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        storage = DictStorage()
+
+        warmup = max(SOAK_REQUESTS // 10, 10 * 1000)
+        await self.run_requests(0, warmup, queue, callback, storage)
+
+        tracemalloc.start()
+        try:
+            before = traced_bytes()
+            await self.run_requests(warmup, warmup + SOAK_REQUESTS,
+                                    queue, callback, storage)
+            after = traced_bytes()
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(after - before, MAX_GROWTH_BYTES)
+        self.assertLessEqual(len(callback._id_to_storage), 100)
+        self.assertEqual(len(queue._pub_pool), 0)
+        self.assertEqual(len(callback._futures), 0)
+        # Some deliveries found every task slot taken and were nacked, then redelivered.
+        self.assertGreater(self.nacks, 0)
+        self.assertGreater(callback.gauges()["callback.storages.evictions"], 0)
+        self.assertEqual(callback.gauges()["callback.storages.rejections"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import google.ai.generativelanguage as glm
+
+from api.task_executors import Gemini
+from api.tasks import DummyTask
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self, release):
+        self.release = release
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.release.wait()
+        finally:
+            self.running -= 1
+        return FakeResponse(prompt)
+
+
+class GeminiKeyPoolTestCase(unittest.IsolatedAsyncioTestCase):
+    def make_executor(self, keys, max_concurrency):
+        self.release = asyncio.Event()
+        executor = Gemini(api_keys=keys, max_concurrency_per_key=max_concurrency)
+        self.models = []
+        for key in executor._keys:
+            key._model = FakeModel(self.release)
+            self.models.append(key._model)
+        return executor
+
+    def run_tasks(self, executor, count):
+        return [asyncio.create_task(executor.run_task(DummyTask(payload={"param1": str(i)})))
+                for i in range(count)]
+
+    async def test_one_model_per_key(self):
+        executor = Gemini(api_keys=["key-a", "key-b"], max_concurrency_per_key=1)
+        self.assertEqual([key.api_key for key in executor._keys], ["key-a", "key-b"])
+        self.assertTrue(executor.is_available())
+
+    async def test_each_key_has_its_own_client(self):
+        executor = Gemini(api_keys=["key-a", "key-b"], max_concurrency_per_key=1)
+        clients = [key.model()._async_client for key in executor._keys]
+
+        self.assertIsNot(clients[0], clients[1])
+        for client, api_key in zip(clients, ["key-a", "key-b"]):
+            self.assertIsInstance(client, glm.GenerativeServiceAsyncClient)
+            transport = client._client._transport
+            self.assertEqual(transport._credentials.token, api_key)
+            # Same user agent as the library's default client.
+            metadata = next(iter(transport._wrapped_methods.values()))._metadata
+            self.assertIn("genai-py/", dict(metadata)["x-goog-api-client"])
+
+    async def test_unchecked_library_version_is_refused(self):
+        executor = Gemini(api_keys=["key-a"], max_concurrency_per_key=1)
+        with mock.patch("google.generativeai.__version__", "0.9.0"):
+            with self.assertRaises(RuntimeError):
+                executor._keys[0].model()
+
+    async def test_calls_go_to_the_least_loaded_key(self):
+        executor = self.make_executor(["key-a", "key-b"], max_concurrency=4)
+
+        tasks = self.run_tasks(executor, 4)
+        await asyncio.sleep(0)
+        self.assertEqual([model.running for model in self.models], [2, 2])
+
+        self.release.set()
+        results = await asyncio.gather(*tasks)
+        self.assertEqual(len(results), 4)
+        self.assertEqual([key.in_flight for key in executor._keys], [0, 0])
+
+    async def test_calls_wait_for_the_key_cap(self):
+        executor = self.make_executor(["key-a", "key-b"], max_concurrency=1)
+
+        tasks = self.run_tasks(executor, 5)
+        await asyncio.sleep(0)
+        self.assertEqual(sum(model.calls for model in self.models), 2)
+
+        self.release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(sum(model.calls for model in self.models), 5)
+        self.assertEqual([model.max_running for model in self.models], [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from api.exceptions import InvalidTaskName, ServiceOverloaded
+from api.storages import DictStorage
+from api.task_queue import (GooglePubSub, GooglePubSubResponseCallback,
+                            GooglePubSubTaskPublisher,
+                            GooglePubSubTopicManager, ReplyRoute)
+from api.tasks import TaskRequest
+from api.wire_codecs import WireCodec
+from tests.fakes import FakePublisherClient, FakeSubscriberClient
+
+CONFIG = {
+    "test-task": {"topic": "quick-topic", "subscription": "quick-sub", "concurrency": 8},
+    "resume-optimization": {"topic": "resume-topic", "subscription": "resume-sub",
+                            "concurrency": 2}
+}
+
+
+class TopicManagerTestCase(unittest.TestCase):
+    def write_config(self, config):
+        with open(self.path, 'w') as f:
+            json.dump(config, f)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "topics.json")
+        self.write_config(CONFIG)
+
+    def test_each_task_has_its_subscription(self):
+        manager = GooglePubSubTopicManager(self.path)
+
+        self.assertEqual(manager.get_topic_sub_pair("resume-optimization"),
+                         ("resume-topic", "resume-sub"))
+        self.assertEqual(manager.get_subscriptions(), {"quick-sub": 8, "resume-sub": 2})
+        with self.assertRaises(InvalidTaskName):
+            manager.get_topic_config("unknown")
+
+    def test_reload(self):
+        manager = GooglePubSubTopicManager(self.path)
+
+        self.write_config({"test-task": CONFIG["test-task"]})
+        manager.reload()
+        self.assertEqual(manager.get_subscriptions(), {"quick-sub": 8})
+
+        self.write_config({"test-task": {"topic": "quick-topic"}})
+        with self.assertRaises(ValueError):
+            manager.reload()
+        self.assertEqual(manager.get_subscriptions(), {"quick-sub": 8})
+
+    def test_development_topics_without_config(self):
+        manager = GooglePubSubTopicManager()
+        self.assertEqual(manager.get_topic_sub_pair("test-task"), ("test-topic", "test-sub"))
+
+    def test_default_concurrency_leaves_tasks_to_schedule(self):
+        self.write_config({"test-task": {"topic": "quick-topic", "subscription": "quick-sub"},
+                           "resume-optimization": CONFIG["resume-optimization"]})
+        manager = GooglePubSubTopicManager(self.path, task_concurrency=3)
+
+        # More messages are leased than the scheduler runs, so it has tasks to reorder.
+        self.assertEqual(manager.get_topic_config("test-task").concurrency, 12)
+        self.assertEqual(manager.get_subscriptions(), {"quick-sub": 12, "resume-sub": 2})
+        self.assertEqual(GooglePubSubTopicManager().get_subscriptions(), {"test-sub": 16})
+
+
+class ConsumerConcurrencyTestCase(unittest.TestCase):
+    def test_consumer_restarts_when_concurrency_changes(self):
+        client = FakeSubscriberClient()
+        queue = GooglePubSub(project="project", pub_client=object(), consumer_client=client)
+
+        queue.consume("resume-sub", print, concurrency=2)
+        queue.consume("resume-sub", print, concurrency=2)
+        self.assertEqual(len(client.subscriptions), 1)
+        self.assertEqual(client.subscriptions[0][1].max_messages, 2)
+
+        queue.consume("resume-sub", print, concurrency=4)
+        self.assertEqual(len(client.subscriptions), 2)
+        self.assertEqual(queue.subscriptions(), {"resume-sub"})
+
+        queue.cancel("resume-sub")
+        self.assertEqual(queue.subscriptions(), set())
+
+
+class InlineReloadTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_removed_subscriptions_stop_being_consumed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "topics.json")
+        with open(path, 'w') as f:
+            json.dump(CONFIG, f)
+
+        queue = GooglePubSub(project="project", pub_client=FakePublisherClient(),
+                             consumer_client=FakeSubscriberClient())
+        publisher = GooglePubSubTaskPublisher(
+            queue=queue, topic_manager=GooglePubSubTopicManager(path),
+            callback=GooglePubSubResponseCallback(loop=asyncio.get_running_loop()),
+            reply_to=None, codec=WireCodec())
+        storage = DictStorage()
+        for i, task_name in enumerate(CONFIG):
+            await storage.create(str(i))
+            await publisher.publish_task(TaskRequest(id=str(i), auth="auth", task_name=task_name,
+                                                     payload={}), storage)
+        self.assertEqual(queue.subscriptions(), {"quick-sub", "resume-sub"})
+
+        with open(path, 'w') as f:
+            json.dump({"test-task": CONFIG["test-task"]}, f)
+        publisher.reload_topics()
+        self.assertEqual(queue.subscriptions(), {"quick-sub"})
+
+
+    async def test_tasks_sharing_a_subscription_share_its_consumer(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "topics.json")
+        with open(path, 'w') as f:
+            json.dump({task_name: {**config, "subscription": "shared-sub"}
+                       for task_name, config in CONFIG.items()}, f)
+
+        client = FakeSubscriberClient()
+        queue = GooglePubSub(project="project", pub_client=FakePublisherClient(),
+                             consumer_client=client)
+        publisher = GooglePubSubTaskPublisher(
+            queue=queue, topic_manager=GooglePubSubTopicManager(path),
+            callback=GooglePubSubResponseCallback(loop=asyncio.get_running_loop()),
+            reply_to=None, codec=WireCodec())
+        storage = DictStorage()
+        for i in range(6):
+            await storage.create(str(i))
+            await publisher.publish_task(TaskRequest(id=str(i), auth="auth",
+                                                     task_name=list(CONFIG)[i % 2],
+                                                     payload={}), storage)
+
+        # Alternating tasks don't restart the pull, which would redeliver its messages.
+        [(subscription, flow_control)] = client.subscriptions
+        self.assertEqual(subscription, "projects/project/subscriptions/shared-sub")
+        self.assertEqual(flow_control.max_messages, 8)
+
+
+class ReplyRouteTestCase(unittest.IsolatedAsyncioTestCase):
+    def test_each_instance_has_its_subscription(self):
+        first = ReplyRoute.for_instance("responses", "responses-sub")
+        second = ReplyRoute.for_instance("responses", "responses-sub")
+        self.assertNotEqual(first.subscription, second.subscription)
+
+        route = ReplyRoute.for_instance("responses", "responses-sub", "api-0")
+        self.assertEqual(route.subscription, "responses-sub-api-0")
+        self.assertEqual(route.filter, 'attributes.reply_key = "api-0"')
+
+    async def test_responses_are_routed_to_the_instance_subscription(self):
+        pub_client, sub_client = FakePublisherClient(), FakeSubscriberClient()
+        queue = GooglePubSub(project="project", pub_client=pub_client,
+                             consumer_client=sub_client)
+        route = ReplyRoute.for_instance("responses", "responses-sub", "api-0")
+        publisher = GooglePubSubTaskPublisher(
+            queue=queue, topic_manager=GooglePubSubTopicManager(),
+            callback=GooglePubSubResponseCallback(loop=asyncio.get_running_loop()),
+            reply_to=route, codec=WireCodec())
+        storage = DictStorage()
+        for request_id in ("1", "2"):
+            await storage.create(request_id)
+            await publisher.publish_task(TaskRequest(id=request_id, auth="auth",
+                                                     task_name="test-task", payload={}), storage)
+
+        # Created once, filtered on the instance's key, and the only subscription consumed.
+        [created] = sub_client.created
+        self.assertEqual(created["name"], "projects/project/subscriptions/responses-sub-api-0")
+        self.assertEqual(created["topic"], "projects/project/topics/responses")
+        self.assertEqual(created["filter"], route.filter)
+        self.assertEqual(queue.subscriptions(), {"responses-sub-api-0"})
+
+        _, data, attributes = pub_client.published[0]
+        request = WireCodec().decode(data, attributes, TaskRequest)
+        self.assertEqual((request.reply_to, request.reply_key), ("responses", "api-0"))
+
+        await publisher.shutdown(timeout=1)
+        self.assertEqual(sub_client.deleted,
+                         ["projects/project/subscriptions/responses-sub-api-0"])
+
+
+class BackpressureTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_full_callback_overloads_the_publisher(self):
+        queue = GooglePubSub(project="project", pub_client=FakePublisherClient(),
+                             consumer_client=FakeSubscriberClient())
+        publisher = GooglePubSubTaskPublisher(
+            queue=queue, topic_manager=GooglePubSubTopicManager(),
+            callback=GooglePubSubResponseCallback(loop=asyncio.get_running_loop(), maxsize=1),
+            reply_to=None, codec=WireCodec())
+        storage = DictStorage()
+        for request_id in ("1", "2"):
+            await storage.create(request_id)
+
+        await publisher.publish_task(TaskRequest(id="1", auth="auth", task_name="test-task",
+                                                 payload={}), storage)
+        with self.assertRaises(ServiceOverloaded):
+            await publisher.publish_task(TaskRequest(id="2", auth="auth", task_name="test-task",
+                                                     payload={}), storage)
+
+
+if __name__ == '__main__':
+    unittest.main()
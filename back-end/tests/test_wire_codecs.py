@@ -0,0 +1,49 @@
+import unittest
+
+from api import wire_codecs
+from api.tasks import TaskRequest
+from api.wire_codecs import CONTENT_ENCODING, CONTENT_TYPE, WireCodec
+
+REQUEST = TaskRequest(id="id", auth="auth", task_name="resume-optimization",
+                      payload={"text": "Experience " * 100})
+
+
+class WireCodecTestCase(unittest.TestCase):
+    def test_json_round_trip(self):
+        codec = WireCodec(compress_threshold=1 << 20)
+        data, attributes = codec.encode(REQUEST)
+
+        self.assertEqual(attributes, {CONTENT_TYPE: "application/json"})
+        self.assertEqual(codec.decode(data, attributes, TaskRequest), REQUEST)
+
+    def test_messages_without_attributes_are_json(self):
+        data = REQUEST.model_dump_json().encode()
+        self.assertEqual(WireCodec().decode(data, None, TaskRequest), REQUEST)
+
+    def test_large_payloads_are_compressed(self):
+        codec = WireCodec(compress_threshold=100)
+        data, attributes = codec.encode(REQUEST)
+
+        self.assertEqual(attributes[CONTENT_ENCODING], "zlib")
+        self.assertLess(len(data), len(REQUEST.model_dump_json()))
+        self.assertEqual(codec.decode(data, attributes, TaskRequest), REQUEST)
+
+    @unittest.skipIf(wire_codecs.msgpack is None, "msgpack is not installed")
+    def test_msgpack_round_trip_and_reply_format(self):
+        codec = WireCodec(codec="msgpack")
+        data, attributes = codec.encode(REQUEST)
+        self.assertEqual(attributes[CONTENT_TYPE], "application/msgpack")
+        self.assertEqual(codec.decode(data, attributes, TaskRequest), REQUEST)
+
+        # A consumer configured for JSON answers a msgpack request in msgpack.
+        _, reply_attributes = WireCodec().encode(
+            REQUEST, content_type=attributes[CONTENT_TYPE])
+        self.assertEqual(reply_attributes[CONTENT_TYPE], "application/msgpack")
+
+    def test_unknown_content_type(self):
+        with self.assertRaises(ValueError):
+            WireCodec().decode(b"", {CONTENT_TYPE: "text/plain"}, TaskRequest)
+
+
+if __name__ == '__main__':
+    unittest.main()
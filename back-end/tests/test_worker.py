@@ -0,0 +1,189 @@
+import asyncio
+import concurrent.futures
+import logging
+import signal
+import unittest
+from unittest import mock
+
+from api import worker
+from api.exceptions import ServiceOverloaded
+from api.schedulers import TaskScheduler
+from api.task_queue import REPLY_KEY, GooglePubSubTopicManager
+from api.task_recv import TaskOrchestrator
+from api.tasks import TaskRequest, TaskResponse
+from api.wire_codecs import WireCodec
+from tests.fakes import FakeMessage, FakeTaskManager
+
+
+class FakeQueue:
+    def __init__(self):
+        self.published = []
+        self.consumers = {}
+        self.shut_down = False
+        # Set to an exception to fail the next publishes, or to a pending future to hold them.
+        self.publish_outcome = None
+
+    def publish(self, data, topic, key, attributes=None):
+        if isinstance(self.publish_outcome, ServiceOverloaded):
+            raise self.publish_outcome
+        self.published.append((topic, key, data, attributes))
+        if isinstance(self.publish_outcome, concurrent.futures.Future):
+            return self.publish_outcome
+        future = concurrent.futures.Future()
+        if isinstance(self.publish_outcome, Exception):
+            future.set_exception(self.publish_outcome)
+        else:
+            future.set_result("message-id")
+        return future
+
+    def consume(self, subscription, callback, concurrency=None):
+        self.consumers[subscription] = concurrency
+
+    def cancel(self, subscription):
+        self.consumers.pop(subscription, None)
+
+    def subscriptions(self):
+        return set(self.consumers)
+
+    def shutdown(self, timeout):
+        self.shut_down = True
+
+
+class TaskOrchestratorTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def make_orchestrator(self, task_manager):
+        self.queue = FakeQueue()
+        return TaskOrchestrator(loop=asyncio.get_running_loop(), task_manager=task_manager,
+                                scheduler=TaskScheduler(), queue=self.queue)
+
+    def make_request(self, reply_to="reply-topic"):
+        return TaskRequest(id="id", auth="auth", task_name="test-task",
+                           payload={}, reply_to=reply_to, reply_key="api-0")
+
+    async def test_response_is_published_to_reply_to(self):
+        orchestrator = self.make_orchestrator(FakeTaskManager())
+        message = FakeMessage()
+
+        await orchestrator._execute_task("id", self.make_request(), message)
+
+        self.assertTrue(message.acked)
+        [(topic, key, data, attributes)] = self.queue.published
+        self.assertEqual((topic, key), ("reply-topic", "id"))
+        # Only the requesting instance's subscription receives it.
+        self.assertEqual(attributes[REPLY_KEY], "api-0")
+        self.assertEqual(WireCodec().decode(data, attributes, TaskResponse).payload,
+                         {"response": "ok"})
+
+    async def test_ack_waits_for_the_published_response(self):
+        orchestrator = self.make_orchestrator(FakeTaskManager())
+        message = FakeMessage()
+        self.queue.publish_outcome = concurrent.futures.Future()
+
+        await orchestrator._execute_task("id", self.make_request(), message)
+        self.assertFalse(message.acked or message.nacked)
+
+        self.queue.publish_outcome.set_result("message-id")
+        self.assertTrue(message.acked)
+
+    async def test_unpublished_response_is_nacked(self):
+        for outcome in (RuntimeError("Publish failed."), ServiceOverloaded("Too many publishes.")):
+            with self.subTest(outcome=outcome):
+                orchestrator = self.make_orchestrator(FakeTaskManager())
+                self.queue.publish_outcome = outcome
+                message = FakeMessage()
+
+                await orchestrator._execute_task("id", self.make_request(), message)
+
+                self.assertTrue(message.nacked)
+                self.assertFalse(message.acked)
+
+    async def test_request_without_reply_to_is_nacked(self):
+        task_manager = FakeTaskManager()
+        orchestrator = self.make_orchestrator(task_manager)
+        message = FakeMessage()
+
+        await orchestrator._execute_task("id", self.make_request(reply_to=None), message)
+
+        self.assertTrue(message.nacked)
+        self.assertFalse(message.acked)
+        self.assertEqual(task_manager.calls, 0)
+
+    async def test_failed_task_is_nacked(self):
+        orchestrator = self.make_orchestrator(FakeTaskManager(fail=True))
+        message = FakeMessage()
+
+        await orchestrator._execute_task("id", self.make_request(), message)
+
+        self.assertTrue(message.nacked)
+        self.assertFalse(message.acked)
+        self.assertEqual(self.queue.published, [])
+
+    async def test_serve_subscribes_then_drains(self):
+        orchestrator = self.make_orchestrator(FakeTaskManager())
+        stop = asyncio.Event()
+        stop.set()
+
+        await orchestrator.serve(GooglePubSubTopicManager(), stop, shutdown_timeout=1)
+
+        self.assertEqual(self.queue.subscriptions(), {"test-sub"})
+        self.assertTrue(self.queue.shut_down)
+
+
+class RunWorkerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    async def test_signals(self):
+        queue = FakeQueue()
+        orchestrator = TaskOrchestrator(loop=asyncio.get_running_loop(),
+                                        task_manager=FakeTaskManager(),
+                                        scheduler=TaskScheduler(), queue=queue)
+        topic_manager = mock.Mock(wraps=GooglePubSubTopicManager())
+        container = mock.Mock()
+        container.orchestrator.return_value = orchestrator
+        container.topic_manager.return_value = topic_manager
+        container.shutdown_timeout.return_value = 1
+
+        # The handlers are called directly rather than through real signals sent to the test runner.
+        handlers = {}
+        loop = asyncio.get_running_loop()
+        with mock.patch("api.worker.Container", return_value=container), \
+                mock.patch.object(loop, "add_signal_handler",
+                                  side_effect=lambda sig, handler: handlers.update({sig: handler})):
+            running = asyncio.create_task(worker.run_worker())
+            await asyncio.sleep(0)  # Runs until the worker waits for a stop signal
+            self.assertEqual(set(handlers), {signal.SIGINT, signal.SIGTERM, signal.SIGHUP})
+            self.assertEqual(queue.subscriptions(), {"test-sub"})
+
+            handlers[signal.SIGHUP]()
+            topic_manager.reload.assert_called_once()
+
+            handlers[signal.SIGTERM]()
+            await asyncio.wait_for(running, timeout=1)
+
+        self.assertTrue(queue.shut_down)
+
+
+class WorkerMainTestCase(unittest.TestCase):
+    def test_reloads_are_ignored_while_starting(self):
+        previous = signal.getsignal(signal.SIGHUP)
+        self.addCleanup(signal.signal, signal.SIGHUP, previous)
+
+        with mock.patch("api.worker.configure_logging"), \
+                mock.patch("api.worker.run_worker", new_callable=mock.AsyncMock) as run_worker:
+            worker.main()
+
+        run_worker.assert_awaited_once()
+        self.assertIs(signal.getsignal(signal.SIGHUP), signal.SIG_IGN)
+
+
+if __name__ == '__main__':
+    unittest.main()